@@ -0,0 +1,267 @@
+# batch_jobs.py
+# Whole-corpus patch generation through an OpenAI-compatible batch endpoint: every prompt goes
+# into one JSONL job file, which is uploaded (/v1/files), run as a batch (/v1/batches), polled
+# until it finishes and downloaded. Results are mapped back to bugs and stored in the LLM
+# response cache, so run_all.py afterwards replays them without sending any request.
+# Batch endpoints trade latency (up to 24h) for throughput and half the price.
+#
+#   python batch_jobs.py submit             # all bugs in all_bugs (--bug-tests for main/Bug Tests)
+#   python batch_jobs.py wait BATCH_ID      # poll, download and cache the results
+#   python batch_jobs.py status BATCH_ID
+#   python run_all.py --batch               # submit, wait and process in one go
+#
+# Try it locally: python llm_stub_server.py &  then OPENAI_BASE_URL=http://127.0.0.1:8766/v1
+import argparse
+import json
+import os
+import shutil
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import llm_accounting
+import llm_backends
+import llm_cache
+import patchmaker
+
+BATCHES_DIR = os.environ.get(
+    "LLM_BATCHES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_batches"),
+)
+ENDPOINT = "/v1/chat/completions"
+COMPLETION_WINDOW = "24h"
+POLL_INTERVAL = float(os.environ.get("LLM_BATCH_POLL", 30))  # seconds before the first status check
+POLL_MAX_INTERVAL = 300.0
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+class BatchError(Exception):
+    """The batch, or one request in it, failed."""
+
+class BatchClient:
+    """Files and batches API of an OpenAI-compatible server."""
+
+    def __init__(self, base_url=llm_backends.BASE_URL, api_key=llm_backends.API_KEY,
+                 max_retries=llm_backends.MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_retries = max_retries
+
+    def request(self, method, path, data=None, content_type="application/json"):
+        """Response bytes, retrying 429/5xx and connection errors with backoff."""
+        headers = {"Content-Type": content_type} if data is not None else {}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        for attempt in range(self.max_retries + 1):
+            request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+            try:
+                with urllib.request.urlopen(request, timeout=llm_backends.REQUEST_TIMEOUT) as response:
+                    return response.read()
+            except urllib.error.HTTPError as e:
+                if e.code not in llm_backends.RETRY_STATUSES or attempt == self.max_retries:
+                    raise BatchError(f"{method} {path}: HTTP {e.code}: {e.read()[:200]!r}") from e
+                retry_after = llm_backends.retry_after_seconds(e.headers)
+            except (urllib.error.URLError, OSError) as e:
+                if attempt == self.max_retries:
+                    raise BatchError(f"{method} {path}: {e}") from e
+                retry_after = None
+            time.sleep(llm_backends.backoff_delay(attempt, retry_after))
+
+    def json(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        return json.loads(self.request(method, path, data))
+
+    def upload(self, path, purpose="batch"):
+        """Upload a file as multipart/form-data; returns its file id."""
+        boundary = uuid.uuid4().hex
+        with open(path, "rb") as f:
+            content = f.read()
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"purpose\"\r\n\r\n{purpose}\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{os.path.basename(path)}\"\r\n"
+            f"Content-Type: application/jsonl\r\n\r\n"
+        ).encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("utf-8")
+        return json.loads(self.request("POST", "/files", body, f"multipart/form-data; boundary={boundary}"))["id"]
+
+    def create(self, input_file_id, metadata=None):
+        return self.json("POST", "/batches", {
+            "input_file_id": input_file_id,
+            "endpoint": ENDPOINT,
+            "completion_window": COMPLETION_WINDOW,
+            "metadata": metadata or {},
+        })
+
+    def get(self, batch_id):
+        return self.json("GET", f"/batches/{batch_id}")
+
+    def cancel(self, batch_id):
+        return self.json("POST", f"/batches/{batch_id}/cancel")
+
+    def content(self, file_id):
+        return self.request("GET", f"/files/{file_id}/content").decode("utf-8")
+
+def job_lines(sources, mode, model=patchmaker.MODEL):
+    """(JSONL request lines, {custom id: key}) for {key: (prompt source, is_excerpt)}."""
+    lines, custom_ids = [], {}
+    for number, (key, (source, excerpt)) in enumerate(sources.items()):
+        custom_id = f"request-{number}"
+        custom_ids[custom_id] = key
+        lines.append(json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": ENDPOINT,
+            "body": {
+                "model": model,
+                "messages": [{"role": "user", "content": patchmaker.build_prompt(source, excerpt, mode)}],
+                **patchmaker.PARAMS,
+            },
+        }))
+    return lines, custom_ids
+
+def batch_dir(batch_id):
+    return os.path.join(BATCHES_DIR, batch_id)
+
+def submit(sources, mode, model=patchmaker.MODEL, client=None):
+    """Write the job file, upload it and start the batch; returns the batch id.
+
+    The job file and a manifest (custom ids, sources, mode) are kept under BATCHES_DIR so
+    that `wait` can map the results back to bugs from another process.
+    """
+    client = client or BatchClient()
+    lines, custom_ids = job_lines(sources, mode, model)
+    staging = batch_dir(f"pending-{uuid.uuid4().hex[:8]}")
+    os.makedirs(staging)
+    input_path = os.path.join(staging, "input.jsonl")
+    with open(input_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    try:
+        batch = client.create(client.upload(input_path), {"description": f"patch generation, {len(lines)} bugs"})
+    except BatchError:
+        shutil.rmtree(staging)
+        raise
+    with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model,
+            "mode": mode,
+            "submitted": time.time(),
+            "requests": {
+                custom_id: {"key": key, "source": sources[key][0], "excerpt": sources[key][1]}
+                for custom_id, key in custom_ids.items()
+            },
+        }, f)
+    os.replace(staging, batch_dir(batch["id"]))
+    return batch["id"]
+
+def wait(batch_id, client=None, interval=POLL_INTERVAL, on_status=None):
+    """Poll until the batch reaches a final status, backing off up to POLL_MAX_INTERVAL; returns it."""
+    client = client or BatchClient()
+    while True:
+        batch = client.get(batch_id)
+        if on_status is not None:
+            on_status(batch)
+        if batch["status"] in FINAL_STATUSES:
+            return batch
+        time.sleep(interval)
+        interval = min(POLL_MAX_INTERVAL, interval * 1.5)
+
+def parse_results(text):
+    """{custom id: (response text or None, usage, error message or None)} from a batch output file."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        body = response.get("body") or {}
+        if item.get("error") or response.get("status_code", 200) >= 400 or not body.get("choices"):
+            error = item.get("error") or body.get("error") or f"HTTP {response.get('status_code')}"
+            results[item["custom_id"]] = (None, {}, str(error.get("message", error) if isinstance(error, dict) else error))
+        else:
+            results[item["custom_id"]] = (body["choices"][0]["message"]["content"], body.get("usage") or {}, None)
+    return results
+
+def collect(batch, client=None, cache=None, accounting=None, bug_ids=None):
+    """{key: response text or BatchError} for a finished batch.
+
+    Results are written to the batch's directory, put in the LLM response cache and recorded in
+    the usage store under bug_ids[key], or the key itself; requests the batch never answered
+    are reported as errors.
+    """
+    client = client or BatchClient()
+    folder = batch_dir(batch["id"])
+    with open(os.path.join(folder, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if cache is None:
+        cache = llm_cache.open_cache()
+    if accounting is None:
+        accounting = llm_accounting.open_store()
+
+    results = {}
+    for field, name in (("output_file_id", "output.jsonl"), ("error_file_id", "errors.jsonl")):
+        if batch.get(field):
+            text = client.content(batch[field])
+            with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+                f.write(text)
+            results.update(parse_results(text))
+
+    model, mode = manifest["model"], manifest["mode"]
+    responses = {}
+    for custom_id, request in manifest["requests"].items():
+        content, usage, error = results.get(custom_id, (None, {}, f"no result (batch {batch['status']})"))
+        if content is None:
+            responses[request["key"]] = BatchError(error)
+        else:
+            responses[request["key"]] = content
+            if cache:
+                version = patchmaker.prompt_version(request["excerpt"], mode)
+                cache.put(model, version, request["source"], patchmaker.PARAMS, content)
+        if accounting:
+            prompt = patchmaker.build_prompt(request["source"], request["excerpt"], mode)
+            accounting.record(llm_accounting.call_record(
+                (bug_ids or {}).get(request["key"], request["key"]), model, mode + llm_accounting.BATCH_SUFFIX, prompt, content, usage,
+                None, None, error=error,
+            ))
+    return responses
+
+def print_status(batch):
+    counts = batch.get("request_counts") or {}
+    print(f"⏳ {batch['id']}: {batch['status']} "
+          f"({counts.get('completed', 0)}/{counts.get('total', '?')} done, {counts.get('failed', 0)} failed)")
+
+def run_batch(sources, mode, bug_ids=None, interval=POLL_INTERVAL, client=None):
+    """Submit, wait for and collect a batch in one call; returns {key: response text or BatchError}."""
+    client = client or BatchClient()
+    batch_id = submit(sources, mode, client=client)
+    print(f"📦 Submitted batch {batch_id} with {len(sources)} requests")
+    batch = wait(batch_id, client, interval, on_status=print_status)
+    return collect(batch, client, bug_ids=bug_ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate patches for a whole corpus through a batch endpoint.")
+    parser.add_argument("command", choices=["submit", "wait", "status", "cancel"])
+    parser.add_argument("batch_id", nargs="?")
+    parser.add_argument("--bug-tests", action="store_true", help="submit main/Bug Tests instead of all_bugs")
+    parser.add_argument("--no-slicing", action="store_true", help="send whole files instead of excerpts")
+    parser.add_argument("--response-mode", choices=["edits", "full"], default=None)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds before the first poll")
+    args = parser.parse_args()
+    if args.command != "submit" and not args.batch_id:
+        parser.error(f"{args.command} needs a batch id")
+
+    client = BatchClient()
+    if args.command == "submit":
+        mode = args.response_mode or patchmaker.RESPONSE_MODE
+        sources = llm_accounting.corpus_sources(args.bug_tests, not args.no_slicing)
+        print(f"📦 Submitted batch {submit(sources, mode, client=client)} with {len(sources)} requests")
+    elif args.command == "status":
+        print_status(client.get(args.batch_id))
+    elif args.command == "cancel":
+        print_status(client.cancel(args.batch_id))
+    else:
+        batch = wait(args.batch_id, client, args.interval, on_status=print_status)
+        responses = collect(batch, client)
+        failed = sum(isinstance(result, BatchError) for result in responses.values())
+        print(f"✅ {len(responses) - failed}/{len(responses)} responses cached")
+        for key, result in responses.items():
+            if isinstance(result, BatchError):
+                print(f"❌ {key}: {result}")
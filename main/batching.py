@@ -0,0 +1,70 @@
+# batching.py
+# Length-bucketed dynamic batching: texts are tokenized in one call to the fast (Rust)
+# tokenizer, which encodes the whole list in parallel, then grouped into buckets of similar
+# token length so every model.encode batch carries as little padding as possible.
+import os
+import numpy as np
+
+BATCH_TOKENS = int(os.environ.get("EMBED_BATCH_TOKENS", 16384))  # padded tokens per batch
+
+def disable_tokenizer_parallelism():
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+def configure_tokenizer_parallelism():
+    """Let the Rust tokenizers use all cores here, but never inside forked children.
+
+    A child forked after the tokenizer thread pool has started can deadlock on its locks;
+    worker pools use spawn, and anything that still forks gets parallelism switched off.
+    """
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=disable_tokenizer_parallelism)
+
+def token_lengths(model, texts):
+    """Token count of each text as the model will see it (special tokens included, truncated)."""
+    if not texts:
+        return []
+    limit = model.max_seq_length or model.tokenizer.model_max_length
+    # One call for the whole list: fast tokenizers encode a batch across all cores
+    encoding = model.tokenizer(
+        list(texts), truncation=True, max_length=limit,
+        return_attention_mask=False, return_token_type_ids=False,
+    )
+    return [len(ids) for ids in encoding["input_ids"]]
+
+def length_buckets(lengths, batch_tokens=BATCH_TOKENS):
+    """Group indices into batches of similar token length so little padding is wasted."""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, batch, batch_max = [], [], 0
+    for i in order:
+        longest = max(batch_max, lengths[i], 1)
+        if batch and longest * (len(batch) + 1) > batch_tokens:
+            batches.append(batch)
+            batch, longest = [], max(lengths[i], 1)
+        batch.append(i)
+        batch_max = longest
+    if batch:
+        batches.append(batch)
+    return batches
+
+def padding_ratio(lengths, batches):
+    """Fraction of the padded token grid that is padding (0 means no waste)."""
+    padded = sum(max(lengths[i] for i in batch) * len(batch) for batch in batches)
+    return 1 - sum(lengths) / padded if padded else 0.0
+
+def encode_batched(model, texts, batch_tokens=BATCH_TOKENS):
+    """Encode texts to normalized embeddings in padding-minimised, length-bucketed batches."""
+    lengths = token_lengths(model, texts)
+    embeddings = None
+    for batch in length_buckets(lengths, batch_tokens):
+        # batch_size=len(batch) keeps each bucket as one forward pass instead of re-splitting it
+        encoded = model.encode(
+            [texts[i] for i in batch], batch_size=len(batch),
+            convert_to_numpy=True, normalize_embeddings=True,
+        )
+        if embeddings is None:
+            embeddings = np.empty((len(texts), encoded.shape[1]), dtype=np.float32)
+        embeddings[batch] = encoded
+    if embeddings is None:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    return embeddings
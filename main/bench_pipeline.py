@@ -0,0 +1,188 @@
+# bench_pipeline.py
+# Runs the whole pipeline (prompt, LLM, apply fix, analyser, json_to_nlp, scoring) on every
+# "Bug Tests" case in-process and reports per-stage timings, with no network access:
+#
+#   python bench_pipeline.py                    # scripted backend answering with each patch.py
+#   python bench_pipeline.py --backend record   # call the real API once, saving fixtures
+#   python bench_pipeline.py --backend replay   # replay those fixtures deterministically
+#
+# Scoring is the lexical stage only unless --transformers is given (models must be cached).
+import argparse
+import difflib
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+import analyser
+import comparison
+import context_slicer
+import json_to_nlp
+import llm_backends
+import patchmaker
+import validation
+
+MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
+BUG_TESTS_ROOT = os.path.join(MAIN_PATH, "Bug Tests")
+STAGES = ["prompt", "generate", "apply", "analyse", "summarise", "score"]
+RUNS = 3
+
+def load_bug_tests(root=BUG_TESTS_ROOT):
+    """{test name: (buggy code, fixed code, explanation)} for every Test folder."""
+    tests = {}
+    for name in sorted(os.listdir(root), key=lambda n: int(re.sub(r"\D", "", n) or 0)):
+        folder = os.path.join(root, name)
+        files = [os.path.join(folder, f) for f in ("bug.py", "patch.py", "explanation.txt")]
+        if not all(os.path.exists(f) for f in files):
+            continue
+        texts = []
+        for path in files:
+            with open(path, encoding="utf-8") as f:
+                texts.append(f.read())
+        tests[name] = tuple(texts)
+    return tests
+
+def unified_diff(buggy_code, fixed_code):
+    return "\n".join(difflib.unified_diff(buggy_code.splitlines(), fixed_code.splitlines(), lineterm=""))
+
+def known_fix_responder(tests):
+    """Responder for ScriptedBackend answering each prompt with the test's real patch and explanation.
+
+    Keyed by the exact prompt: some Bug Tests differ only by whitespace (Test 6 and Test 7 by
+    a trailing newline), so anything normalised would answer one test with another's fix.
+    """
+    by_prompt = {}
+    for name, (buggy_code, fixed_code, explanation) in tests.items():
+        excerpt = context_slicer.excerpt_for_bug(buggy_code, unified_diff(buggy_code, fixed_code))[0]
+        for source, is_excerpt in ((buggy_code, False), (excerpt, True)):
+            for mode in ("edits", "full"):
+                prompt = patchmaker.build_prompt(source, is_excerpt, mode)
+                known = by_prompt.get(prompt)
+                assert known is None or known[0] == name, f"{name} and {known[0]} share a prompt"
+                by_prompt[prompt] = (name, is_excerpt, mode)
+
+    def respond(prompt):
+        name, is_excerpt, mode = by_prompt[prompt]
+        buggy_code, fixed_code, explanation = tests[name]
+        if mode == "edits":
+            code = unified_diff(buggy_code, fixed_code)
+        elif is_excerpt:
+            code = "```python\n" + context_slicer.build_excerpt(
+                fixed_code, context_slicer.diff_changed_lines(fixed_code, buggy_code)) + "\n```"
+        else:
+            code = f"```python\n{fixed_code}\n```"
+        return f"{code}\n{patchmaker.DELIMITER}\n{explanation}"
+
+    return respond
+
+def run_case(buggy_code, fixed_code, backend, mode, use_slicing, transformers, workdir):
+    """One pass of the pipeline; returns ({stage: seconds}, score)."""
+    timings = {}
+    start = time.perf_counter()
+    if use_slicing:
+        source, excerpt = context_slicer.excerpt_for_bug(buggy_code, unified_diff(buggy_code, fixed_code))
+    else:
+        source, excerpt = buggy_code, False
+    timings["prompt"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = patchmaker.fix_and_explain_code(
+        source, cache=False, excerpt=excerpt, mode=mode, backend=backend, accounting=False
+    )
+    timings["generate"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    code_part, explanation = patchmaker.split_response(result)
+    patched = patchmaker.fixed_code_from(buggy_code, code_part, excerpt, mode) if code_part is not None else ""
+    if patched:
+        patched = validation.validate_and_repair(
+            buggy_code, patched,
+            repair=lambda context, message: patchmaker.repair_code(
+                context, message, backend=backend, cache=False, accounting=False
+            ),
+        )
+    old_path, new_path = os.path.join(workdir, "code1.py"), os.path.join(workdir, "code2.py")
+    for path, text in ((old_path, buggy_code), (new_path, patched)):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    timings["apply"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    changes = analyser.analyze_patch(old_path, new_path)
+    timings["analyse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    summary = json_to_nlp.render_nlp(changes)
+    timings["summarise"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if transformers:
+        with comparison.suppress_output():
+            _, results = comparison.compare_texts(explanation, summary, band=None)
+        scores = [score for _, score, error, _ in results if error is None]
+        score = statistics.mean(scores) if scores else None
+    else:
+        score = comparison.lexical.lexical_score(explanation, summary)
+    timings["score"] = time.perf_counter() - start
+    return timings, score
+
+def benchmark(backend, mode, use_slicing=True, transformers=False, runs=RUNS, tests=None):
+    """{test name: {"seconds": {stage: median seconds}, "score": ...} or {"error": ...}}."""
+    tests = tests or load_bug_tests()
+    report = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, (buggy_code, fixed_code, _) in tests.items():
+            samples = []
+            try:
+                for _ in range(runs):
+                    samples.append(run_case(buggy_code, fixed_code, backend, mode, use_slicing, transformers, workdir))
+            except Exception as e:
+                report[name] = {"error": f"{type(e).__name__}: {e}"}
+                continue
+            report[name] = {
+                "seconds": {stage: statistics.median(t[stage] for t, _ in samples) for stage in STAGES},
+                "score": samples[-1][1],
+            }
+    return report
+
+def print_report(report):
+    print(f"{'test':<10}" + "".join(f"{stage:>11}" for stage in STAGES) + f"{'score':>8}")
+    totals = dict.fromkeys(STAGES, 0.0)
+    for name, entry in report.items():
+        if "error" in entry:
+            print(f"{name:<10} ⚠️ {entry['error']}")
+            continue
+        for stage in STAGES:
+            totals[stage] += entry["seconds"][stage]
+        score = f"{entry['score']:.2f}" if entry["score"] is not None else "-"
+        print(f"{name:<10}" + "".join(f"{entry['seconds'][stage] * 1000:>9.1f}ms" for stage in STAGES) + f"{score:>8}")
+    print(f"{'total':<10}" + "".join(f"{totals[stage] * 1000:>9.1f}ms" for stage in STAGES))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline full-pipeline benchmark on the Bug Tests.")
+    parser.add_argument("--backend", choices=["fake", "replay", "record", "http"], default="fake",
+                        help="fake answers with each test's patch.py; replay needs fixtures from a record run")
+    parser.add_argument("--response-mode", choices=["edits", "full"], default=patchmaker.RESPONSE_MODE)
+    parser.add_argument("--no-slicing", action="store_true", help="always send the whole buggy file")
+    parser.add_argument("--transformers", action="store_true", help="score with the transformer models too")
+    parser.add_argument("--runs", type=int, default=RUNS, help="median over this many passes per test")
+    parser.add_argument("--output", help="also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    tests = load_bug_tests()
+    if args.backend == "fake":
+        backend = llm_backends.ScriptedBackend(known_fix_responder(tests))
+    else:
+        backend = llm_backends.get_backend(args.backend)
+    runs = 1 if args.backend in ("record", "http") else args.runs  # don't pay for repeated API calls
+
+    report = benchmark(backend, args.response_mode, not args.no_slicing, args.transformers, runs, tests)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if any("error" in entry for entry in report.values()):
+        sys.exit(1)
@@ -0,0 +1,119 @@
+# bench_startup.py
+# Measures `python -X importtime` for each pipeline entry point and fails on regressions.
+#
+#   python bench_startup.py            # compare against startup_baseline.json
+#   python bench_startup.py --update   # record the current timings as the new baseline
+#
+# The baseline is machine-specific and not committed; without one the check fails.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(MAIN_PATH, "startup_baseline.json")
+
+ENTRY_POINTS = [
+    "comparison",
+    "corpus_scoring",
+    "scoring_client",
+    "scoring_daemon",
+    "embedding_cache",
+    "score_store",
+    "run_all",
+    "json_to_nlp",
+]
+
+# Must never be pulled in just by importing an entry point
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "datasets"]
+
+RUNS = 5
+TOLERANCE = 0.25  # allowed relative slowdown against the baseline
+SLACK_MS = 20.0  # absolute slack so tiny modules don't fail on timer noise
+
+def measure_import(module):
+    """Import a module in a fresh interpreter; returns (cumulative ms, imported module names)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=MAIN_PATH,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    cumulative_ms, imported = None, set()
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[1].strip().isdigit():
+            continue  # header line
+        name = fields[2].strip()
+        imported.add(name.split(".")[0])
+        if name == module:
+            cumulative_ms = int(fields[1]) / 1000
+    return cumulative_ms, imported
+
+def benchmark(runs=RUNS):
+    """Median import time of every entry point; entries that fail to import are reported as errors."""
+    timings, errors = {}, {}
+    for module in ENTRY_POINTS:
+        try:
+            samples = []
+            for _ in range(runs):
+                cumulative_ms, imported = measure_import(module)
+                samples.append(cumulative_ms)
+            heavy = sorted(imported.intersection(HEAVY_MODULES))
+            if heavy:
+                errors[module] = f"imports heavy modules at startup: {', '.join(heavy)}"
+            timings[module] = statistics.median(samples)
+        except RuntimeError as e:
+            errors[module] = f"import failed: {e}"
+    return timings, errors
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark of the pipeline entry points.")
+    parser.add_argument("--update", action="store_true", help="write the measured timings as the new baseline")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    args = parser.parse_args()
+
+    timings, errors = benchmark(args.runs)
+
+    failed = False
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+    elif not args.update:
+        # Timings depend on the machine, so the baseline is recorded locally rather than committed
+        print(f"❌ No baseline at {BASELINE_FILE}; record one with: python bench_startup.py --update")
+        failed = True
+
+    for module in ENTRY_POINTS:
+        if module in errors:
+            print(f"❌ {module}: {errors[module]}")
+            failed = True
+            continue
+        ms = timings[module]
+        allowed = baseline.get(module)
+        if allowed is None:
+            print(f"→ {module}: {ms:.1f} ms (no baseline)")
+        elif ms > allowed * (1 + TOLERANCE) + SLACK_MS:
+            print(f"❌ {module}: {ms:.1f} ms, baseline {allowed:.1f} ms")
+            failed = True
+        else:
+            print(f"✅ {module}: {ms:.1f} ms, baseline {allowed:.1f} ms")
+
+    if args.update:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(timings, f, indent=2)
+        print(f"Baseline saved to {BASELINE_FILE}")
+    elif failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# candidates.py
+# Ranks several candidate fixes for one bug (patchmaker.generate_candidates asks for k of them
+# in a single request). Every candidate is applied, syntax- and structure-checked, analysed
+# (analyser.py / json_to_nlp.py) and scored lexically in parallel worker processes; only the
+# best ones go on to the expensive embedding comparison.
+#
+# The ranking score is a weighted sum of features in [0, 1]:
+#   valid       applied cleanly, parses, and keeps the buggy file's top-level definitions
+#   consensus   share of the other candidates that produced the same fixed code
+#   small_diff  prefers fixes touching few lines
+#   lexical     lexical agreement between the explanation and the analyser's summary
+# CANDIDATE_WEIGHTS='{"lexical": 3}' overrides individual weights.
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import analyser
+import context_slicer
+import json_to_nlp
+import lexical
+import patch_apply
+import patchmaker
+import validation
+
+CANDIDATES = int(os.environ.get("LLM_CANDIDATES", 1))
+WEIGHTS = {"valid": 10.0, "consensus": 2.0, "small_diff": 1.0, "lexical": 1.0}
+WEIGHTS.update(json.loads(os.environ.get("CANDIDATE_WEIGHTS", "{}")))
+SMALL_DIFF_LINES = 10  # a fix changing this many lines scores 0.5 on small_diff
+WORKERS = int(os.environ.get("CANDIDATE_WORKERS", os.cpu_count() or 1))
+
+def check_candidate(buggy_code, response, excerpt=False, mode="full"):
+    """Apply, check and analyse one candidate response (runs in a worker process)."""
+    code_part, explanation = patchmaker.split_response(response)
+    candidate = {
+        "response": response, "explanation": explanation, "fixed_code": None, "error": None,
+        "changes": {}, "summary": "", "changed_lines": 0, "lexical": 0.0,
+    }
+    if code_part is None:
+        candidate["error"] = "no bugs found"
+        return candidate
+    try:
+        fixed_code = patchmaker.fixed_code_from(buggy_code, code_part, excerpt, mode)
+    except (patch_apply.PatchApplyError, context_slicer.SliceError) as e:
+        candidate["error"] = str(e)
+        return candidate
+    candidate["fixed_code"] = fixed_code
+    if fixed_code.strip() == buggy_code.strip():
+        candidate["error"] = "the fix changes nothing"
+        return candidate
+    candidate["error"] = validation.structure_error(buggy_code, fixed_code)
+    if candidate["error"] is not None:
+        return candidate
+
+    with tempfile.TemporaryDirectory() as workdir:
+        old_path, new_path = os.path.join(workdir, "code1.py"), os.path.join(workdir, "code2.py")
+        for path, text in ((old_path, buggy_code), (new_path, fixed_code)):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        candidate["changes"] = analyser.analyze_patch(old_path, new_path)
+    candidate["summary"] = json_to_nlp.render_nlp(candidate["changes"])
+    candidate["changed_lines"] = len(context_slicer.diff_changed_lines(buggy_code, fixed_code))
+    candidate["lexical"] = lexical.lexical_score(explanation, candidate["summary"])
+    return candidate
+
+def features(candidate, candidates):
+    valid = candidate["fixed_code"] is not None and candidate["error"] is None
+    same = sum(other["fixed_code"] == candidate["fixed_code"] for other in candidates) - 1
+    return {
+        "valid": float(valid),
+        "consensus": same / (len(candidates) - 1) if valid and len(candidates) > 1 else 0.0,
+        "small_diff": SMALL_DIFF_LINES / (SMALL_DIFF_LINES + candidate["changed_lines"]) if valid else 0.0,
+        "lexical": candidate["lexical"] if valid else 0.0,
+    }
+
+def rank_candidates(buggy_code, responses, excerpt=False, mode="full", weights=None, workers=WORKERS):
+    """Candidates (dicts, see check_candidate) best first, each with its "features" and "score"."""
+    weights = {**WEIGHTS, **(weights or {})}
+    unique = list(dict.fromkeys(responses))  # sampled candidates often repeat; check each once
+    workers = min(workers, len(unique))
+    # fork only: spawn would re-import the analysis stack in every worker, costing more than it
+    # saves. Forking a process that runs other threads (aiohttp, tokenizers) can copy their locks
+    # held, so then, as where fork is missing (Windows), the candidates are checked one by one
+    if workers > 1 and "fork" in multiprocessing.get_all_start_methods() and threading.active_count() == 1:
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            results = executor.map(
+                check_candidate, [buggy_code] * len(unique), unique, [excerpt] * len(unique), [mode] * len(unique)
+            )
+            by_response = dict(zip(unique, results))
+    else:
+        by_response = {response: check_candidate(buggy_code, response, excerpt, mode) for response in unique}
+    checked = [dict(by_response[response]) for response in responses]
+
+    for number, candidate in enumerate(checked, start=1):
+        candidate["number"] = number
+        candidate["features"] = features(candidate, checked)
+        candidate["score"] = sum(weights.get(name, 0.0) * value for name, value in candidate["features"].items())
+    # Ties keep the order the model returned the candidates in
+    return sorted(checked, key=lambda candidate: -candidate["score"])
+
+def print_ranking(ranked):
+    for candidate in ranked:
+        status = "✅" if candidate["features"]["valid"] else f"❌ {candidate['error']}"
+        detail = ", ".join(f"{name} {value:.2f}" for name, value in candidate["features"].items())
+        print(f"   #{candidate['number']}: score {candidate['score']:.2f} ({detail}) {status}")
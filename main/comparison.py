@@ -1,14 +1,20 @@
-from sentence_transformers import SentenceTransformer, util
-from transformers import AutoTokenizer, AutoModel
-import torch #pip install torch
+# torch, transformers and sentence_transformers are imported lazily in load_sentence_transformer:
+# importing them takes seconds and is not needed for --help, the daemon client or cached scores
+import argparse
 import os
 import logging
-import transformers
-import datasets #pip install datasets
-import sentence_transformers
 import contextlib
+import re
 import sys
-import os
+import time
+import numpy as np
+import lexical
+import model_manager
+import score_store
+import scoring_client
+import batching
+import model_registry
+from embedding_cache import EmbeddingCache
 
 @contextlib.contextmanager
 def suppress_output():
@@ -26,7 +32,7 @@ def suppress_output():
 # Silence Hugging Face and tokenizers
 os.environ["TRANSFORMERS_NO_ADVISORY_WARNINGS"] = "true"
 os.environ["TRANSFORMERS_VERBOSITY"] = "error"
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
+batching.configure_tokenizer_parallelism()
 
 # Disable all logging
 logging.getLogger().setLevel(logging.ERROR)
@@ -37,48 +43,362 @@ logging.getLogger("filelock").setLevel(logging.ERROR)
 logging.getLogger("datasets").setLevel(logging.ERROR)
 logging.getLogger("torch").setLevel(logging.ERROR)
 
-# Force transformers to shut up entirely (legacy)
-transformers.logging.set_verbosity_error()
+# "torch" (default) or "onnx" for int8 ONNX Runtime models on CPU-only machines (see onnx_backend.py)
+BACKEND = os.environ.get("SCORING_BACKEND", "torch")
 
-# Define semantic models to use (model name: loading function)
-semantic_models = {
+def import_model_stack():
+    """Import transformers/sentence_transformers (slow, so only once a model is needed)."""
+    import transformers
+    import sentence_transformers
+
+    # Force transformers to shut up entirely (legacy)
+    transformers.logging.set_verbosity_error()
+    return sentence_transformers
+
+def load_sentence_transformer(model_id, backend=None):
+    """Import the model stack on first use and load a SentenceTransformer."""
+    SentenceTransformer = import_model_stack().SentenceTransformer
+    if (backend or BACKEND) == "onnx":
+        import onnx_backend
+        return onnx_backend.load_onnx_model(model_id)
+    # Models populated in the offline registry load without the hub (see model_registry.py)
+    if model_registry.local_path(model_id) is not None:
+        return model_registry.load_registered_model(model_id)
+    return SentenceTransformer(model_id)
+
+# Define semantic models to use (model name: hub id)
+MODEL_IDS = {
     # Sentence-Transformers (optimized for semantic similarity)
-    "all-MiniLM-L6-v2": lambda: SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2"),
-    "paraphrase-MiniLM-L3-v2": lambda: SentenceTransformer("sentence-transformers/paraphrase-MiniLM-L3-v2"),
-    "multi-qa-MiniLM-L6-cos-v1": lambda: SentenceTransformer("sentence-transformers/multi-qa-MiniLM-L6-cos-v1"),
-    "sentence-t5-base": lambda: SentenceTransformer("sentence-transformers/sentence-t5-base"),
-    
+    "all-MiniLM-L6-v2": "sentence-transformers/all-MiniLM-L6-v2",
+    "paraphrase-MiniLM-L3-v2": "sentence-transformers/paraphrase-MiniLM-L3-v2",
+    "multi-qa-MiniLM-L6-cos-v1": "sentence-transformers/multi-qa-MiniLM-L6-cos-v1",
+    "sentence-t5-base": "sentence-transformers/sentence-t5-base",
+
     # Hugging Face models adapted for sentence embeddings (STS-evaluated)
-    "intfloat/e5-base": lambda: SentenceTransformer("intfloat/e5-base"),
-    "BAAI/bge-small-en-v1.5": lambda: SentenceTransformer("BAAI/bge-small-en-v1.5"),
+    "intfloat/e5-base": "intfloat/e5-base",
+    "BAAI/bge-small-en-v1.5": "BAAI/bge-small-en-v1.5",
 }
 
-def compare_with_models(explanation_file, nlp_file):
-    """Compare explanation and summary using multiple semantic models."""
-    with open(explanation_file, 'r') as f:
-        explanation_text = f.read().strip()
+# Relative inference cost (millions of parameters), used to balance and order work
+MODEL_COSTS = {
+    "all-MiniLM-L6-v2": 22,
+    "paraphrase-MiniLM-L3-v2": 17,
+    "multi-qa-MiniLM-L6-cos-v1": 22,
+    "sentence-t5-base": 110,
+    "intfloat/e5-base": 110,
+    "BAAI/bge-small-en-v1.5": 33,
+}
 
-    with open(nlp_file, 'r') as f:
-        nlp_summary = f.read().strip()
+# Model name: loading function
+semantic_models = {
+    model_name: (lambda model_id=model_id: load_sentence_transformer(model_id))
+    for model_name, model_id in MODEL_IDS.items()
+}
+
+# Chunking and pooling of long texts (models silently truncate past max_seq_length)
+CHUNK_OVERLAP = 32  # tokens shared between consecutive chunks
+POOLING = "coverage"  # one of POOLING_METHODS
+MATCH_THRESHOLD = 0.6
+
+# Lexical first stage (opt-in, --cascade): pairs scoring at or below LOW / at or above HIGH
+# are settled without the transformer models, everything in between is escalated. Not yet
+# calibrated against the transformer verdicts: matching Bug Tests pairs score only 0.05-0.20
+# lexically, so the cascade stays off by default to leave the oracle's output unchanged.
+LEXICAL_BAND = (0.05, 0.85)
+
+def chunk_text(text, tokenizer, max_tokens, overlap=CHUNK_OVERLAP):
+    """Split text into windows of at most max_tokens tokens of the given tokenizer."""
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    return window_offsets(text, encoding["offset_mapping"], max_tokens, overlap)
+
+def chunk_texts(texts, tokenizer, max_tokens, overlap=CHUNK_OVERLAP):
+    """chunk_text for many texts with one (parallel, for fast tokenizers) tokenizer call."""
+    encoding = tokenizer(list(texts), add_special_tokens=False, return_offsets_mapping=True)
+    return [
+        window_offsets(text, offsets, max_tokens, overlap)
+        for text, offsets in zip(texts, encoding["offset_mapping"])
+    ]
+
+def window_offsets(text, offsets, max_tokens, overlap=CHUNK_OVERLAP):
+    """Cut text into overlapping windows given its token character offsets."""
+    if len(offsets) <= max_tokens:
+        return [text], [max(1, len(offsets))]
+
+    chunks, lengths = [], []
+    step = max(1, max_tokens - overlap)
+    for start in range(0, len(offsets), step):
+        window = offsets[start:start + max_tokens]
+        chunks.append(text[window[0][0]:window[-1][1]])
+        lengths.append(len(window))
+        if start + max_tokens >= len(offsets):
+            break
+    return chunks, lengths
+
+def model_chunk_budget(model):
+    """Number of content tokens a model can see in one sequence."""
+    limit = model.max_seq_length or model.tokenizer.model_max_length
+    return limit - model.tokenizer.num_special_tokens_to_add()
+
+def pool_max(sim, expl_lengths, nlp_lengths):
+    """Best-matching chunk pair."""
+    return float(sim.max())
+
+def pool_mean(sim, expl_lengths, nlp_lengths):
+    """Average over every chunk pair."""
+    return float(sim.mean())
+
+def pool_coverage(sim, expl_lengths, nlp_lengths):
+    """How well each side's chunks are covered by the other, weighted by chunk length."""
+    nlp_covered = np.average(sim.max(axis=0), weights=nlp_lengths)
+    expl_covered = np.average(sim.max(axis=1), weights=expl_lengths)
+    return float((nlp_covered + expl_covered) / 2)
+
+def split_units(text):
+    """Split text into sentences and bullets; summary bullets keep their "Function: x" context."""
+    units, context = [], ""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            context = ""
+            continue
+        header = re.match(r"^function:\s*(.+)$", line, flags=re.IGNORECASE)
+        if header:
+            context = f"in function {header.group(1)}: "
+            continue
+        bullet = re.match(r"^(?:[-*•]|\d+[.)])\s+(.*)$", line)
+        if bullet:
+            units.append(context + bullet.group(1))
+            continue
+        units.extend(sentence for sentence in re.split(r"(?<=[.!?])\s+", line) if sentence)
+    return units
+
+def alignment_scores(sim):
+    """Sentence-level precision, recall and F1 from an explanation x summary similarity matrix.
+
+    Precision: how well each explanation sentence is supported by some summary bullet.
+    Recall: how well each summary bullet is covered by some explanation sentence.
+    """
+    precision = float(sim.max(axis=1).mean())
+    recall = float(sim.max(axis=0).mean())
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+    return precision, recall, f1
+
+class AlignmentScore(float):
+    """F1 of a sentence alignment, carrying its precision and recall along for reports."""
+
+    def __new__(cls, precision, recall, f1):
+        score = super().__new__(cls, f1)
+        score.precision, score.recall = precision, recall
+        return score
+
+    def __reduce__(self):
+        # Keeps precision and recall when results come back from parallel_scoring workers
+        return AlignmentScore, (self.precision, self.recall, float(self))
+
+def pool_alignment(sim, expl_lengths, nlp_lengths):
+    """F1 of the sentence alignment (texts are segmented into sentences, not token windows)."""
+    return AlignmentScore(*alignment_scores(sim))
+
+POOLING_METHODS = {
+    "max": pool_max,
+    "mean": pool_mean,
+    "coverage": pool_coverage,
+    "alignment": pool_alignment,
+}
+
+def segment_text(text, model, pooling=POOLING):
+    """Segments to encode for a pooling method: sentences for alignment, token windows otherwise."""
+    if pooling == "alignment":
+        units = split_units(text)
+        if units:
+            return units, [1] * len(units)
+        return [text], [1]
+    return chunk_text(text, model.tokenizer, model_chunk_budget(model))
+
+def segment_texts(texts, model, pooling=POOLING):
+    """segment_text for many texts, tokenizing them in a single batch."""
+    if pooling == "alignment" or not texts:
+        return [segment_text(text, model, pooling) for text in texts]
+    return chunk_texts(texts, model.tokenizer, model_chunk_budget(model))
+
+def model_revision(model_name):
+    """Revision of the weights a model name resolves to (hub default branch unless pinned)."""
+    revision = model_registry.pinned_revision(MODEL_IDS.get(model_name, model_name)) or "main"
+    # int8 ONNX embeddings differ from the PyTorch ones, so they must not share cache entries
+    return revision if BACKEND == "torch" else f"{revision}+{BACKEND}-int8"
+
+def encode_cached(model, model_name, texts, cache=None):
+    """Encode texts to normalized embeddings, only sending cache misses to the model (length-bucketed)."""
+    if cache is None:
+        return batching.encode_batched(model, texts)
+
+    revision = model_revision(model_name)
+    cached = cache.get_many(model_name, revision, texts)
+    missing = [i for i, embedding in enumerate(cached) if embedding is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        encoded = batching.encode_batched(model, missing_texts)
+        cache.put_many(model_name, revision, missing_texts, encoded)
+        for i, embedding in zip(missing, encoded):
+            cached[i] = embedding
+    return np.stack([np.asarray(embedding, dtype=np.float32) for embedding in cached])
+
+def score_with_model(model, explanation_text, nlp_summary, pooling=POOLING, model_name=None, cache=None):
+    """Segment both texts (token windows, or sentences for alignment), encode in one batch and pool."""
+    (expl_chunks, expl_lengths), (nlp_chunks, nlp_lengths) = segment_texts(
+        [explanation_text, nlp_summary], model, pooling
+    )
+
+    # One batched call per model for all chunks of both texts
+    embeddings = encode_cached(model, model_name, expl_chunks + nlp_chunks, cache)
+    expl_embeds = embeddings[:len(expl_chunks)]
+    nlp_embeds = embeddings[len(expl_chunks):]
+
+    # Cosine similarity of every explanation chunk with every summary chunk
+    sim = expl_embeds @ nlp_embeds.T
+    return POOLING_METHODS[pooling](sim, expl_lengths, nlp_lengths)
+
+def load_quietly(load_model):
+    with suppress_output():
+        return load_model()
+
+def new_model_manager(rss_budget=model_manager.RSS_BUDGET, verbose=False):
+    """Model lifecycle manager over semantic_models (see model_manager.py)."""
+    loaders = {
+        model_name: (lambda load_model=load_model: load_quietly(load_model))
+        for model_name, load_model in semantic_models.items()
+    }
+    return model_manager.ModelManager(loaders, MODEL_COSTS, rss_budget, verbose, prepare=import_model_stack)
+
+def score_texts(explanation_text, nlp_summary, pooling=POOLING, manager=None, cache=None, model_names=None):
+    """Score a text pair with every semantic model, loading and releasing models through manager.
+
+    Returns (model name, score, error, seconds) tuples; seconds includes loading the model.
+    """
+    manager = manager or new_model_manager()
+    results = []
+    for model_name in semantic_models:
+        if model_names is not None and model_name not in model_names:
+            continue
+        start = time.perf_counter()
+        try:
+            with manager.stage(model_name):
+                model = manager.get(model_name)
+                score = score_with_model(model, explanation_text, nlp_summary, pooling, model_name, cache)
+            results.append((model_name, score, None, time.perf_counter() - start))
+        except Exception as e:
+            results.append((model_name, None, str(e), time.perf_counter() - start))
+        finally:
+            model = None
+            manager.done(model_name)
+    if cache is not None:
+        cache.flush()
+    return results
+
+def lexical_stage(explanation_text, nlp_summary, band=LEXICAL_BAND, idf=None):
+    """First cascade stage: returns (lexical score, verdict), verdict None when the pair is uncertain."""
+    score = lexical.lexical_score(explanation_text, nlp_summary, idf)
+    low, high = band
+    if score >= high:
+        return score, True
+    if score <= low:
+        return score, False
+    return score, None
+
+def print_results(results, stage="transformer"):
+    for model_name, score, error, seconds in results:
+        if error is not None:
+            print(f"⚠️ Error using model '{model_name}': {error}")
+        else:
+            parts = f" (precision {score.precision:.2f}, recall {score.recall:.2f})" if isinstance(score, AlignmentScore) else ""
+            print(f"→ [{model_name}]: Semantic Match Score: {score:.2f}{parts} | {'✅ Match' if score >= MATCH_THRESHOLD else '❌ No Match'} (decided by {stage} stage)")
+
+def compare_texts(explanation_text, nlp_summary, pooling=POOLING, band=None, early_stop=False,
+                  log_memory=False):
+    """Run the comparison stages on two texts and print the outcome.
+
+    Returns (stage, results): stage is "lexical" when the cheap first stage settled the pair,
+    otherwise "transformer"; results are (name, score, error, seconds) tuples as from score_texts.
+    The lexical stage only runs when a band is given (see LEXICAL_BAND).
+    """
+    # Lexical stage on the original text (case is needed to split camelCase identifiers)
+    if band is not None:
+        start = time.perf_counter()
+        lexical_score, verdict = lexical_stage(explanation_text, nlp_summary, band)
+        if verdict is not None:
+            print(f"→ [lexical]: Lexical Match Score: {lexical_score:.2f} | {'✅ Match' if verdict else '❌ No Match'} (decided by lexical stage)")
+            return "lexical", [("lexical", lexical_score, None, time.perf_counter() - start)]
+        print(f"↪ [lexical]: Lexical Match Score: {lexical_score:.2f} is in the uncertainty band {band}, escalating to transformer models")
 
     # Normalize case
     explanation_text = explanation_text.lower()
     nlp_summary = nlp_summary.lower()
 
+    if early_stop:
+        import ensemble  # imported here: ensemble imports this module
+        outcome = ensemble.score_ensemble(explanation_text, nlp_summary, pooling, cache=EmbeddingCache())
+        results = [(name, score, None, outcome["seconds"][name]) for name, score in outcome["scores"].items()]
+        results += [(name, None, error, outcome["seconds"][name]) for name, error in outcome["errors"].items()]
+        print_results(results)
+        if outcome["verdict"] is not None:
+            print(f"⏹ Ensemble verdict: {'✅ Match' if outcome['verdict'] else '❌ No Match'} | mean {outcome['mean']:.2f} | agreement {outcome['agreement']:.0%} | skipped {len(outcome['skipped'])} of {len(semantic_models)} models")
+        return "transformer", results
+
+    # Use the warm scoring daemon when one is running, otherwise load models here
+    results = scoring_client.request_scores(explanation_text, nlp_summary, pooling)
+    if results is None:
+        import parallel_scoring  # imported here: its worker processes import this module
+        results = parallel_scoring.score_texts_parallel(explanation_text, nlp_summary, pooling, log_memory=log_memory)
+
+    print_results(results)
+    return "transformer", results
+
+def compare_with_models(explanation_file, nlp_file, pooling=POOLING, band=None, early_stop=False,
+                        bug_id=None, store=True, log_memory=False):
+    """Compare explanation and summary using multiple semantic models.
+
+    Returns (stage, results) from compare_texts. With store=True the results are also
+    appended to the score store (see score_store.py).
+    """
+    with open(explanation_file, 'r') as f:
+        explanation_text = f.read().strip()
+
+    with open(nlp_file, 'r') as f:
+        nlp_summary = f.read().strip()
+
     print("🔍 Comparing Full Explanation with NLP Summary:\n")
 
-    for model_name, load_model in semantic_models.items():
+    start = time.perf_counter()
+    stage, results = compare_texts(explanation_text, nlp_summary, pooling, band, early_stop, log_memory)
+    total_seconds = time.perf_counter() - start
+
+    if store:
         try:
-            with suppress_output():
-                model = load_model()
-            # Encode
-            expl_embed = model.encode(explanation_text, convert_to_tensor=True)
-            nlp_embed = model.encode(nlp_summary, convert_to_tensor=True)
-            # Cosine similarity
-            score = util.pytorch_cos_sim(expl_embed, nlp_embed).item()
-            print(f"→ [{model_name}]: Semantic Match Score: {score:.2f} | {'✅ Match' if score >= 0.6 else '❌ No Match'}")
+            score_store.append_comparison(
+                bug_id, stage, results, explanation_text, nlp_summary,
+                pooling=pooling, band=band or LEXICAL_BAND, threshold=MATCH_THRESHOLD, backend=BACKEND,
+                revisions={model_name: model_revision(model_name) for model_name in semantic_models},
+                total_seconds=total_seconds,
+            )
         except Exception as e:
-            print(f"⚠️ Error using model '{model_name}': {e}")
+            print(f"⚠️ Could not store scores: {e}")
+    return stage, results
 
 if __name__ == "__main__":
-    compare_with_models("explanation.txt", "nlp_output.txt")
+    parser = argparse.ArgumentParser(description="Compare an LLM explanation with the NLP summary of a patch.")
+    parser.add_argument("explanation_file", nargs="?", default="explanation.txt")
+    parser.add_argument("nlp_file", nargs="?", default="nlp_output.txt")
+    parser.add_argument("--pooling", choices=sorted(POOLING_METHODS), default=POOLING)
+    parser.add_argument("--lexical-band", type=float, nargs=2, metavar=("LOW", "HIGH"), default=LEXICAL_BAND,
+                        help="with --cascade, lexical scores inside this band go on to the transformer models")
+    parser.add_argument("--cascade", action="store_true",
+                        help="settle clear pairs with the lexical stage before the transformer models")
+    parser.add_argument("--early-stop", action="store_true",
+                        help="run models cheapest first and stop once the ensemble verdict is settled")
+    parser.add_argument("--bug-id", help="bug the texts belong to, recorded in the score store")
+    parser.add_argument("--no-store", action="store_true", help="do not append the results to the score store")
+    parser.add_argument("--log-memory", action="store_true", help="log model loads, releases and peak RSS per model")
+    args = parser.parse_args()
+    band = tuple(args.lexical_band) if args.cascade else None
+    compare_with_models(args.explanation_file, args.nlp_file, args.pooling, band, args.early_stop,
+                        bug_id=args.bug_id, store=not args.no_store, log_memory=args.log_memory)
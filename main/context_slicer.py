@@ -0,0 +1,388 @@
+# context_slicer.py
+# Builds a reduced prompt context for a buggy file: the definitions touched by the bug's
+# hunks are kept in full together with what they use (called helpers, referenced globals,
+# imports); every other function and class is reduced to its signature with a "..." body.
+# splice() puts the definitions of the model's fixed excerpt back into the full file.
+#
+#   python context_slicer.py "Bug Tests/Test 6/bug.py" --fixed "Bug Tests/Test 6/patch.py"
+# prints how much smaller the excerpt is than the whole file.
+import argparse
+import ast
+import copy
+import difflib
+import re
+import textwrap
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+MIN_SLICE_CHARS = 8 * 1024  # smaller files are cheap enough to send whole
+MAX_SLICE_RATIO = 0.5  # an excerpt this close to the full size is not worth the splice risk
+MAX_DEFAULT_CHARS = 30  # longer default values are shown as ... in signatures
+DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef)
+
+class SliceError(Exception):
+    """The excerpt could not be built or spliced back; send the whole file instead."""
+
+def changed_lines(patch_text, path=None):
+    """Buggy-file line numbers removed or changed by a unified diff (insertions mark the next line)."""
+    lines, current, old_line = set(), None, None
+    for line in patch_text.splitlines():
+        if line.startswith("diff --git"):
+            current = line.split()[-1][2:]
+            old_line = None
+        elif line.startswith("+++ "):
+            name = line[4:].split("\t")[0].strip()
+            current = name[2:] if name.startswith("b/") else name
+        elif line.startswith("--- "):
+            continue
+        elif HUNK_HEADER.match(line):
+            old_line = int(HUNK_HEADER.match(line).group(1))
+        elif old_line is not None and (path is None or current is None or current == path):
+            if line.startswith("-"):
+                lines.add(old_line)
+                old_line += 1
+            elif line.startswith("+"):
+                lines.add(old_line)
+            elif not line.startswith("\\"):
+                old_line += 1
+    return lines
+
+def diff_changed_lines(buggy_code, fixed_code):
+    """changed_lines for two full versions of a file (Bug Tests ship bug.py and patch.py)."""
+    diff = difflib.unified_diff(buggy_code.splitlines(), fixed_code.splitlines(), lineterm="", n=0)
+    return changed_lines("\n".join(diff))
+
+def keyed(body, prefix=""):
+    """(key, node) for the definitions directly in body.
+
+    The key is the qualified name, e.g. 'APIRouter.add_api_route'; a repeated name in the same
+    body (a @property getter and its setter, typing overloads) gets its position appended,
+    'Model.value#2', so that every definition keeps its own entry.
+    """
+    seen = {}
+    for node in body:
+        if isinstance(node, DEFINITIONS):
+            seen[node.name] = seen.get(node.name, 0) + 1
+            suffix = f"#{seen[node.name]}" if seen[node.name] > 1 else ""
+            yield prefix + node.name + suffix, node
+
+def base_name(key):
+    """Qualified name of a definitions() key, without the position of a repeated name."""
+    return key.split("#", 1)[0]
+
+def definitions(tree):
+    """Functions and classes (also nested in classes) by key (see keyed)."""
+    found = {}
+
+    def visit(body, prefix):
+        for key, node in keyed(body, prefix):
+            found[key] = node
+            if isinstance(node, ast.ClassDef):
+                visit(node.body, key + ".")
+
+    visit(tree.body, "")
+    return found
+
+def span(node):
+    """First and last source line of a statement, decorators included."""
+    start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+    return start, node.end_lineno
+
+def overlaps(node, lines):
+    start, end = span(node)
+    return any(start <= line <= end for line in lines)
+
+def bound_names(node):
+    """Names a module-level import or assignment binds."""
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        return {(alias.asname or alias.name).split(".")[0] for alias in node.names}
+    if isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        return {name.id for target in targets for name in ast.walk(target) if isinstance(name, ast.Name)}
+    if isinstance(node, DEFINITIONS):
+        return {node.name}
+    return set()
+
+def used_names(node):
+    """Global names and self./cls. attributes a definition refers to."""
+    names, attributes = set(), set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            names.add(child.id)
+        elif isinstance(child, ast.Attribute) and isinstance(child.value, ast.Name) and child.value.id in ("self", "cls"):
+            attributes.add(child.attr)
+    return names, attributes
+
+def target_definitions(defs, lines):
+    """Innermost function containing each changed line, and classes changed outside any method."""
+    targets, classes = set(), set()
+    for line in lines:
+        containing = [name for name, node in defs.items() if overlaps(node, [line])]
+        if containing:
+            innermost = max(containing, key=lambda name: span(defs[name])[0])
+            (classes if isinstance(defs[innermost], ast.ClassDef) else targets).add(innermost)
+    return targets, classes
+
+def compact_arguments(arguments):
+    """Signature without annotations and with long defaults elided, to keep stubs short."""
+    def bare(arg):
+        arg = copy.copy(arg)
+        arg.annotation = None
+        return arg
+
+    def short(default):
+        if default is None or len(ast.unparse(default)) <= MAX_DEFAULT_CHARS:
+            return default
+        return ast.Constant(...)
+
+    arguments = copy.copy(arguments)
+    arguments.posonlyargs = [bare(arg) for arg in arguments.posonlyargs]
+    arguments.args = [bare(arg) for arg in arguments.args]
+    arguments.kwonlyargs = [bare(arg) for arg in arguments.kwonlyargs]
+    arguments.vararg = arguments.vararg and bare(arguments.vararg)
+    arguments.kwarg = arguments.kwarg and bare(arguments.kwarg)
+    arguments.defaults = [short(default) for default in arguments.defaults]
+    arguments.kw_defaults = [short(default) for default in arguments.kw_defaults]
+    return arguments
+
+def stub(node, indent):
+    """A definition reduced to its decorators and compact signature, with a '...' body."""
+    reduced = copy.copy(node)
+    reduced.body = [ast.Expr(ast.Constant(...))]
+    if isinstance(node, FUNCTIONS):
+        reduced.args = compact_arguments(node.args)
+        reduced.returns = None
+    return textwrap.indent(ast.unparse(reduced), indent) + "\n"
+
+def class_header(node):
+    """'class X(Base):' line(s) with decorators, without the body."""
+    header = copy.copy(node)
+    header.body = []
+    return ast.unparse(header).rstrip() + "\n"
+
+def source_of(lines, node):
+    start, end = span(node)
+    return "".join(lines[start - 1:end])
+
+def build_excerpt(buggy_code, lines):
+    """Excerpt of buggy_code for the changed line numbers; raises SliceError if nothing is touched."""
+    try:
+        tree = ast.parse(buggy_code)
+    except SyntaxError as e:
+        raise SliceError(f"cannot parse file: {e}")
+    source_lines = buggy_code.splitlines(keepends=True)
+    defs = definitions(tree)
+    targets, changed_classes = target_definitions(defs, lines)
+    module_hits = [node for node in tree.body if not isinstance(node, DEFINITIONS) and overlaps(node, lines)]
+    if not targets and not changed_classes and not module_hits:
+        raise SliceError("no changed lines inside the file")
+
+    # Dependencies of the targets: called helpers and same-class methods in full (one level),
+    # then every global and import that the kept code refers to
+    keep = set(targets)
+    for name in targets:
+        names, attributes = used_names(defs[name])
+        owner = name.rsplit(".", 1)[0] if "." in name else None
+        wanted = names | ({f"{owner}.{a}" for a in attributes} if owner else set())
+        keep.update(key for key, node in defs.items() if base_name(key) in wanted and isinstance(node, FUNCTIONS))
+    # Classes shown as header + members: those changed at class level and owners of kept methods
+    partial = set(changed_classes)
+    for name in keep | changed_classes:
+        parts = name.split(".")
+        partial.update(".".join(parts[:i]) for i in range(1, len(parts)))
+
+    referenced = set()
+    for name in keep:
+        referenced |= used_names(defs[name])[0]
+    class_hits = [
+        node for name in changed_classes for node in defs[name].body
+        if not isinstance(node, DEFINITIONS) and overlaps(node, lines)
+    ]
+    for node in module_hits + class_hits:
+        referenced |= used_names(node)[0]
+
+    def render(body, prefix):
+        parts = []
+        keys = {id(node): key for key, node in keyed(body, prefix)}
+        for node in body:
+            indent = source_lines[node.lineno - 1][:node.col_offset]
+            if isinstance(node, DEFINITIONS):
+                name = keys[id(node)]
+                if name in keep:
+                    parts.append(source_of(source_lines, node))
+                elif name in partial:
+                    parts.append(textwrap.indent(class_header(node), indent))
+                    parts.extend(render(node.body, name + "."))
+                elif prefix == "" or isinstance(node, FUNCTIONS):
+                    parts.append(stub(node, indent))
+            elif node in module_hits or node in class_hits or (prefix == "" and bound_names(node) & referenced):
+                parts.append(source_of(source_lines, node))
+        return parts
+
+    return "".join(render(tree.body, ""))
+
+def excerpt_for_bug(buggy_code, patch_text, path=None):
+    """Prompt source for a bug: (excerpt, True) for large files, else (buggy_code, False)."""
+    if len(buggy_code) < MIN_SLICE_CHARS:
+        return buggy_code, False
+    try:
+        excerpt = build_excerpt(buggy_code, changed_lines(patch_text, path))
+    except SliceError:
+        return buggy_code, False
+    if len(excerpt) > MAX_SLICE_RATIO * len(buggy_code):
+        return buggy_code, False
+    return excerpt, True
+
+def is_stub(node):
+    body = node.body
+    return len(body) == 1 and isinstance(body[0], ast.Expr) and getattr(body[0].value, "value", None) is Ellipsis
+
+def reindent(text, indent):
+    return textwrap.indent(textwrap.dedent(text), indent)
+
+def assignment_edits(original_body, fixed_body, fixed_lines, indent):
+    """Replacements for assignments whose value the fix changed, matched by the names they bind."""
+    originals = {
+        frozenset(bound_names(node)): node for node in original_body
+        if isinstance(node, (ast.Assign, ast.AnnAssign))
+    }
+    edits = []
+    for node in fixed_body:
+        if not isinstance(node, (ast.Assign, ast.AnnAssign)):
+            continue
+        original = originals.get(frozenset(bound_names(node)))
+        if original is not None and ast.unparse(original) != ast.unparse(node):
+            edits.append((*span(original), reindent(source_of(fixed_lines, node), indent)))
+    return edits
+
+def check_mapped(original_body, fixed_body, where, imports=False):
+    """Raise SliceError for a statement of the fixed body that splice cannot carry over.
+
+    Definitions, (module-level) imports and assignments are spliced; any other statement
+    (if/try blocks, expressions, augmented assignments, ...) must be unchanged from the original.
+    """
+    originals = {ast.unparse(node) for node in original_body}
+    assigned = {
+        frozenset(bound_names(node)) for node in original_body if isinstance(node, (ast.Assign, ast.AnnAssign))
+    }
+    for node in fixed_body:
+        if isinstance(node, DEFINITIONS) or (imports and isinstance(node, (ast.Import, ast.ImportFrom))):
+            continue
+        if isinstance(node, (ast.Assign, ast.AnnAssign)) and frozenset(bound_names(node)) in assigned:
+            continue
+        if ast.unparse(node) not in originals:
+            raise SliceError(f"cannot splice the changed {where} statement on line {node.lineno} of the excerpt")
+
+def splice(buggy_code, fixed_excerpt):
+    """Apply every function the fixed excerpt changed or added to the full buggy file.
+
+    Raises SliceError when the excerpt changes something that cannot be mapped back.
+    """
+    try:
+        original_tree = ast.parse(buggy_code)
+        fixed_tree = ast.parse(fixed_excerpt)
+    except SyntaxError as e:
+        raise SliceError(f"cannot parse: {e}")
+    lines = buggy_code.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    fixed_lines = fixed_excerpt.splitlines(keepends=True)
+    original_defs = definitions(original_tree)
+    edits = []  # (first line, last line, replacement); last = first - 1 inserts before first
+
+    def resolve(name):
+        """Original qualified name for a fixed-excerpt definition (methods may come without their class)."""
+        if name in original_defs:
+            return name
+        matches = [known for known in original_defs if known.endswith("." + name)]
+        return matches[0] if len(matches) == 1 else None
+
+    def indent_of(node):
+        return lines[node.lineno - 1][:node.col_offset]
+
+    following = {}  # definition name -> names of the definitions after it in the same body
+
+    def collect(body, prefix):
+        names = [key for key, _ in keyed(body, prefix)]
+        for i, name in enumerate(names):
+            following[name] = names[i + 1:]
+        for key, node in keyed(body, prefix):
+            if isinstance(node, ast.ClassDef):
+                collect(node.body, key + ".")
+
+    check_mapped(original_tree.body, fixed_tree.body, "module-level", imports=True)
+    collect(fixed_tree.body, "")
+    for name, node in definitions(fixed_tree).items():
+        if is_stub(node):
+            continue
+        original_name = resolve(name)
+        original = original_defs.get(original_name)
+        if original is not None and isinstance(original, ast.ClassDef):
+            # Classes are partial in the excerpt: only the header and class-level assignments
+            # are compared here, methods are spliced one by one
+            check_mapped(original.body, node.body, f"class-level ({name})")
+            if class_header(node) != class_header(original):
+                start = span(original)[0]
+                edits.append((start, original.body[0].lineno - 1, reindent(class_header(node), indent_of(original))))
+            edits.extend(assignment_edits(original.body, node.body, fixed_lines, indent_of(original.body[0])))
+            continue
+        new_source = source_of(fixed_lines, node)
+        if original is None:
+            owner = original_defs.get(name.rsplit(".", 1)[0]) if "." in name else None
+            if "." in name and owner is None:
+                continue  # member of a class that is itself new; inserted with the class
+            # Keep the excerpt's order: insert before the next definition the original also has
+            successor = next((original_defs[resolve(n)] for n in following[name] if resolve(n)), None)
+            if successor is not None:
+                gap = "\n" if owner is not None else "\n\n"
+                start = span(successor)[0]
+                edits.append((start, start - 1, reindent(new_source, indent_of(successor)) + gap))
+            elif owner is not None:
+                member_indent = indent_of(owner.body[0])
+                edits.append((owner.end_lineno + 1, owner.end_lineno, "\n" + reindent(new_source, member_indent)))
+            else:
+                edits.append((len(lines) + 1, len(lines), "\n\n" + reindent(new_source, "")))
+            continue
+        replacement = reindent(new_source, indent_of(original))
+        start, end = span(original)
+        if replacement != "".join(lines[start - 1:end]):
+            edits.append((start, end, replacement))
+
+    # Module-level imports and assignments the fix added or changed
+    original_imports = {ast.unparse(node) for node in original_tree.body}
+    last_import = max([node.end_lineno for node in original_tree.body
+                       if isinstance(node, (ast.Import, ast.ImportFrom))], default=0)
+    for node in fixed_tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)) and ast.unparse(node) not in original_imports:
+            edits.append((last_import + 1, last_import, source_of(fixed_lines, node)))
+    edits.extend(assignment_edits(original_tree.body, fixed_tree.body, fixed_lines, ""))
+
+    for start, end, replacement in sorted(edits, key=lambda edit: edit[0], reverse=True):
+        if not replacement.endswith("\n"):
+            replacement += "\n"
+        lines[start - 1:end] = [replacement]
+    return "".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the prompt excerpt for a buggy file.")
+    parser.add_argument("buggy_file")
+    parser.add_argument("--patch", help="unified diff of the fix (e.g. bug_patch.txt)")
+    parser.add_argument("--fixed", help="fixed version of the file, if there is no diff")
+    parser.add_argument("--show", action="store_true", help="print the excerpt")
+    args = parser.parse_args()
+
+    with open(args.buggy_file, encoding="utf-8") as f:
+        buggy_code = f.read()
+    if args.patch:
+        with open(args.patch, encoding="utf-8") as f:
+            lines = changed_lines(f.read())
+    elif args.fixed:
+        with open(args.fixed, encoding="utf-8") as f:
+            lines = diff_changed_lines(buggy_code, f.read())
+    else:
+        parser.error("one of --patch or --fixed is required")
+
+    excerpt = build_excerpt(buggy_code, lines)
+    if args.show:
+        print(excerpt)
+    print(f"✂️ {len(buggy_code)} -> {len(excerpt)} chars ({len(buggy_code) / max(1, len(excerpt)):.1f}x smaller)")
@@ -0,0 +1,48 @@
+# corpus.py
+# Loads (explanation, NLP summary) pairs for every bug in a "Bug Tests" style folder:
+#   <root>/<bug id>/bug.py, patch.py, explanation.txt [, nlp_output.txt]
+import os
+import json_to_nlp
+from analyser import analyze_patch
+
+MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
+BUG_TESTS_ROOT = os.path.join(MAIN_PATH, "Bug Tests")
+
+def summarize_bug(bug_path: str) -> str:
+    """NLP summary of a bug folder, reusing nlp_output.txt if the pipeline already wrote one."""
+    nlp_file = os.path.join(bug_path, "nlp_output.txt")
+    if os.path.exists(nlp_file):
+        with open(nlp_file) as f:
+            return f.read()
+    changes = analyze_patch(os.path.join(bug_path, "bug.py"), os.path.join(bug_path, "patch.py"))
+    return json_to_nlp.render_nlp(changes)
+
+def load_corpus(root: str = BUG_TESTS_ROOT) -> list:
+    """Return a list of {"bug_id", "explanation", "summary"} dicts in their original case.
+
+    The lexical stage needs the case to split camelCase identifiers; use model_texts for the
+    transformer models.
+    """
+    pairs = []
+    for bug_id in sorted(os.listdir(root)):
+        bug_path = os.path.join(root, bug_id)
+        explanation_file = os.path.join(bug_path, "explanation.txt")
+        if not os.path.isfile(explanation_file):
+            continue
+        try:
+            summary = summarize_bug(bug_path)
+        except Exception as e:
+            print(f"⚠️ Skipping {bug_id}: could not summarize patch ({e})")
+            continue
+        with open(explanation_file) as f:
+            explanation = f.read()
+        pairs.append({
+            "bug_id": bug_id,
+            "explanation": explanation.strip(),
+            "summary": summary.strip(),
+        })
+    return pairs
+
+def model_texts(pairs: list) -> list:
+    """Explanations then summaries of the pairs, lowercased like compare_texts does for the models."""
+    return [pair["explanation"].lower() for pair in pairs] + [pair["summary"].lower() for pair in pairs]
@@ -0,0 +1,119 @@
+# corpus_scoring.py
+# Model-major scoring: every (explanation, summary) pair of the corpus is collected first,
+# then each model is loaded once and encodes all texts in length-bucketed batches.
+import argparse
+import time
+import numpy as np
+
+import comparison
+import lexical
+from corpus import BUG_TESTS_ROOT, load_corpus, model_texts
+from embedding_cache import EmbeddingCache
+
+def encode_corpus(model, model_name, texts, cache=None, pooling=comparison.POOLING):
+    """Segment and encode every text; returns the chunk embedding matrix and each text's chunk rows."""
+    chunks, spans = [], []
+    for text_chunks, text_lengths in comparison.segment_texts(texts, model, pooling):
+        spans.append((len(chunks), text_lengths))
+        chunks.extend(text_chunks)
+
+    # encode_cached buckets the cache misses by token length (batching.encode_batched)
+    return comparison.encode_cached(model, model_name, chunks, cache), spans
+
+def score_pairs(embeddings, expl_spans, nlp_spans, pooling=comparison.POOLING):
+    """Pool chunk similarities for every pair; single-chunk pairs share one row-wise dot product."""
+    scores = np.empty(len(expl_spans), dtype=np.float32)
+    single = [i for i in range(len(expl_spans)) if len(expl_spans[i][1]) == 1 and len(nlp_spans[i][1]) == 1]
+    if single:
+        expl_rows = embeddings[[expl_spans[i][0] for i in single]]
+        nlp_rows = embeddings[[nlp_spans[i][0] for i in single]]
+        scores[single] = np.einsum("ij,ij->i", expl_rows, nlp_rows)
+
+    single = set(single)
+    for i in range(len(expl_spans)):
+        if i in single:
+            continue
+        (expl_start, expl_lengths), (nlp_start, nlp_lengths) = expl_spans[i], nlp_spans[i]
+        expl_embeds = embeddings[expl_start:expl_start + len(expl_lengths)]
+        nlp_embeds = embeddings[nlp_start:nlp_start + len(nlp_lengths)]
+        sim = expl_embeds @ nlp_embeds.T
+        scores[i] = comparison.POOLING_METHODS[pooling](sim, expl_lengths, nlp_lengths)
+    return scores
+
+def score_corpus(pairs, pooling=comparison.POOLING, cache=None, manager=None):
+    """Score every pair with every model, loading each model only once.
+
+    Returns {bug_id: [(model_name, score, error, seconds), ...]} in the same shape as score_texts.
+    """
+    results = {pair["bug_id"]: [] for pair in pairs}
+    texts = model_texts(pairs)
+    manager = manager or comparison.new_model_manager()
+
+    for model_name in comparison.semantic_models:
+        start = time.perf_counter()
+        try:
+            with manager.stage(model_name):
+                model = manager.get(model_name)
+                embeddings, spans = encode_corpus(model, model_name, texts, cache, pooling)
+            scores = score_pairs(embeddings, spans[:len(pairs)], spans[len(pairs):], pooling)
+            seconds = time.perf_counter() - start
+            for pair, score in zip(pairs, scores):
+                # Time is shared by the whole batch, so each pair gets its amortized share
+                results[pair["bug_id"]].append((model_name, float(score), None, seconds / len(pairs)))
+            print(f"✅ [{model_name}]: scored {len(pairs)} pairs in {seconds:.1f}s")
+        except Exception as e:
+            for pair in pairs:
+                results[pair["bug_id"]].append((model_name, None, str(e), 0.0))
+            print(f"⚠️ Error using model '{model_name}': {e}")
+        finally:
+            # Each model is needed exactly once, so free it before loading the next
+            model = None
+            manager.release(model_name)
+    if cache is not None:
+        cache.flush()
+    return results
+
+def cascade_corpus(pairs, band=comparison.LEXICAL_BAND, pooling=comparison.POOLING, cache=None):
+    """Lexical stage for every pair first; only pairs in the uncertainty band reach the models.
+
+    Returns ({bug_id: stage}, {bug_id: results}).
+    """
+    idf = lexical.inverse_document_frequencies(
+        [lexical.normalize_tokens(pair[key]) for pair in pairs for key in ("explanation", "summary")]
+    )
+    stages, results, uncertain = {}, {}, []
+    for pair in pairs:
+        start = time.perf_counter()
+        score, verdict = comparison.lexical_stage(pair["explanation"], pair["summary"], band, idf)
+        if verdict is None:
+            uncertain.append(pair)
+        else:
+            stages[pair["bug_id"]] = "lexical"
+            results[pair["bug_id"]] = [("lexical", score, None, time.perf_counter() - start)]
+    print(f"↪ Lexical stage settled {len(pairs) - len(uncertain)} of {len(pairs)} pairs")
+    if uncertain:
+        for bug_id, bug_results in score_corpus(uncertain, pooling, cache).items():
+            stages[bug_id] = "transformer"
+            results[bug_id] = bug_results
+    return stages, {pair["bug_id"]: results[pair["bug_id"]] for pair in pairs}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score every bug of a corpus, one model at a time.")
+    parser.add_argument("root", nargs="?", default=BUG_TESTS_ROOT)
+    parser.add_argument("--cascade", action="store_true", help="settle clear pairs with the lexical stage first")
+    parser.add_argument("--pooling", choices=sorted(comparison.POOLING_METHODS), default=comparison.POOLING)
+    args = parser.parse_args()
+
+    pairs = load_corpus(args.root)
+    if args.cascade:
+        stages, results = cascade_corpus(pairs, pooling=args.pooling, cache=EmbeddingCache())
+    else:
+        stages, results = {}, score_corpus(pairs, args.pooling, cache=EmbeddingCache())
+    for bug_id, bug_results in results.items():
+        print(f"\n🔍 {bug_id}" + (f" (decided by {stages[bug_id]} stage)" if bug_id in stages else ""))
+        for model_name, score, error, seconds in bug_results:
+            if error is not None:
+                print(f"⚠️ Error using model '{model_name}': {error}")
+            else:
+                label = "Lexical" if model_name == "lexical" else "Semantic"
+                print(f"→ [{model_name}]: {label} Match Score: {score:.2f} | {'✅ Match' if score >= comparison.MATCH_THRESHOLD else '❌ No Match'}")
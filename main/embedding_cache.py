@@ -0,0 +1,153 @@
+# embedding_cache.py
+# Disk-backed embedding cache keyed by (model name, model revision, normalized-text hash).
+# Each embedding is a float16 .npy file that is memory-mapped on read; index.json records
+# size and last use of every entry so the cache can be kept under a size cap (LRU).
+# Processes sharing the cache merge their index updates under a lock on index.lock.
+import contextlib
+import hashlib
+import json
+import os
+import re
+import time
+import numpy as np
+
+CACHE_DIR = os.environ.get(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".embedding_cache"),
+)
+MAX_CACHE_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+INDEX_FILE = "index.json"
+LOCK_FILE = "index.lock"
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different copies of a text share one entry."""
+    return re.sub(r"\s+", " ", text).strip()
+
+@contextlib.contextmanager
+def locked(path):
+    """Hold an exclusive lock on the file at path (created if missing) while the block runs."""
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # gives up after ~10s of retries
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def cache_key(model_name, revision, text):
+    text_hash = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    model_hash = hashlib.sha256(f"{model_name}@{revision}".encode("utf-8")).hexdigest()[:16]
+    return f"{model_hash}-{text_hash}"
+
+class EmbeddingCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._read_index()
+        self.removed = {}  # key -> time this process dropped it, so flush does not merge it back
+        self.dirty = False
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, INDEX_FILE)
+
+    def _read_index(self):
+        try:
+            with open(self._index_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, model_name, revision, text):
+        """Return the cached float16 embedding (memory-mapped) or None."""
+        key = cache_key(model_name, revision, text)
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        try:
+            embedding = np.load(os.path.join(self.cache_dir, entry["file"]), mmap_mode="r")
+        except (OSError, ValueError):
+            # File evicted by another process or damaged; forget it
+            del self.index[key]
+            self.removed[key] = time.time()
+            self.dirty = True
+            return None
+        entry["last_used"] = time.time()
+        self.dirty = True
+        return embedding
+
+    def put(self, model_name, revision, text, embedding):
+        key = cache_key(model_name, revision, text)
+        file_name = f"{key}.npy"
+        path = os.path.join(self.cache_dir, file_name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(embedding, dtype=np.float16))
+        os.replace(tmp_path, path)
+        self.index[key] = {
+            "file": file_name,
+            "bytes": os.path.getsize(path),
+            "last_used": time.time(),
+        }
+        self.removed.pop(key, None)
+        self.dirty = True
+
+    def get_many(self, model_name, revision, texts):
+        """Look up several texts; returns a list with None for every miss."""
+        return [self.get(model_name, revision, text) for text in texts]
+
+    def put_many(self, model_name, revision, texts, embeddings):
+        for text, embedding in zip(texts, embeddings):
+            self.put(model_name, revision, text, embedding)
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        total = sum(entry["bytes"] for entry in self.index.values())
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["file"]))
+            except OSError:
+                pass
+            total -= entry["bytes"]
+            del self.index[key]
+            self.removed[key] = time.time()
+            self.dirty = True
+
+    def flush(self):
+        """Merge with the on-disk index (other processes may have written), evict and save."""
+        if not self.dirty:
+            return
+        # Without the lock, two workers flushing at once could both read the old index and
+        # the last write would drop the other's entries (leaving their .npy files untracked)
+        with locked(os.path.join(self.cache_dir, LOCK_FILE)):
+            on_disk = self._read_index()
+            for key, entry in on_disk.items():
+                if entry["last_used"] <= self.removed.get(key, -1):
+                    continue  # dropped here; only an entry written again since then comes back
+                ours = self.index.get(key)
+                if ours is None or entry["last_used"] > ours["last_used"]:
+                    self.index[key] = entry
+            self.evict()
+            tmp_path = f"{self._index_path()}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.index, f)
+            os.replace(tmp_path, self._index_path())
+        self.removed.clear()
+        self.dirty = False
@@ -0,0 +1,173 @@
+# ensemble.py
+# Sequential early stopping over the model ensemble. The ensemble verdict is "mean score of
+# all models >= MATCH_THRESHOLD". Models run from cheapest to most expensive, and after each
+# one we check whether the remaining models could still flip the verdict, given how far each
+# of them has historically strayed from the other models' mean (model_score_stats.json, kept
+# in the embedding cache directory; MODEL_SCORE_STATS overrides the path).
+#
+#   python ensemble.py calibrate [--root DIR]   # record historical spreads from a full run
+#   python ensemble.py [--root DIR]             # early-stopping run, reports skipped calls
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+import comparison
+import corpus_scoring
+from corpus import BUG_TESTS_ROOT, load_corpus, model_texts
+from embedding_cache import CACHE_DIR, EmbeddingCache
+
+# Local calibration, kept next to the embeddings it was computed from rather than in the source tree
+STATS_FILE = os.environ.get("MODEL_SCORE_STATS", os.path.join(CACHE_DIR, "model_score_stats.json"))
+MIN_MODELS = 2  # never decide on a single model
+SPREAD_QUANTILES = (0.05, 0.95)
+
+def model_order():
+    """Model names from cheapest to most expensive."""
+    return sorted(comparison.semantic_models, key=lambda name: comparison.MODEL_COSTS.get(name, 1))
+
+def load_stats(path=STATS_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def calibrate(results, path=STATS_FILE):
+    """Per model, the spread of (its score - mean of the other models) over a fully scored corpus."""
+    deviations = {model_name: [] for model_name in comparison.semantic_models}
+    for bug_results in results.values():
+        scores = {name: score for name, score, error, seconds in bug_results if error is None}
+        if len(scores) < 2:
+            continue
+        for name, score in scores.items():
+            others = [s for other, s in scores.items() if other != name]
+            deviations[name].append(score - sum(others) / len(others))
+
+    stats = {}
+    for name, values in deviations.items():
+        if values:
+            low, high = np.quantile(values, SPREAD_QUANTILES)
+            stats[name] = {"dev_low": float(low), "dev_high": float(high), "pairs": len(values)}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(stats, f, indent=2)
+    return stats
+
+def settled_verdict(scores, remaining, stats, threshold=comparison.MATCH_THRESHOLD):
+    """True/False once no outcome of the remaining models can flip the mean verdict, else None."""
+    if len(scores) < MIN_MODELS and remaining:
+        return None
+    total = sum(scores.values())
+    n = len(scores) + len(remaining)
+    if not remaining:
+        return total / n >= threshold
+
+    running_mean = total / len(scores)
+    best, worst = total, total
+    for name in remaining:
+        # Without history a model could land anywhere in the cosine range
+        spread = stats.get(name, {"dev_low": -2.0, "dev_high": 2.0})
+        best += min(1.0, running_mean + spread["dev_high"])
+        worst += max(-1.0, running_mean + spread["dev_low"])
+    if worst / n >= threshold:
+        return True
+    if best / n < threshold:
+        return False
+    return None
+
+def agreement(scores, verdict, threshold=comparison.MATCH_THRESHOLD):
+    """Fraction of the models run so far whose own verdict matches the ensemble verdict."""
+    return sum((score >= threshold) == verdict for score in scores.values()) / len(scores)
+
+def score_ensemble(explanation_text, nlp_summary, pooling=comparison.POOLING, stats=None, cache=None):
+    """Run models cheapest first, stopping as soon as the ensemble verdict is settled."""
+    stats = load_stats() if stats is None else stats
+    order = model_order()
+    scores, errors, seconds = {}, {}, {}
+    verdict = None
+    for i, model_name in enumerate(order):
+        start = time.perf_counter()
+        try:
+            with comparison.suppress_output():
+                model = comparison.semantic_models[model_name]()
+            scores[model_name] = comparison.score_with_model(
+                model, explanation_text, nlp_summary, pooling, model_name, cache
+            )
+        except Exception as e:
+            errors[model_name] = str(e)
+        seconds[model_name] = time.perf_counter() - start
+        model = None
+        if scores:
+            verdict = settled_verdict(scores, order[i + 1:], stats)
+        if verdict is not None:
+            break
+    if cache is not None:
+        cache.flush()
+    run = set(scores) | set(errors)
+    return {
+        "verdict": verdict,
+        "mean": sum(scores.values()) / len(scores) if scores else None,
+        "agreement": agreement(scores, verdict) if scores and verdict is not None else None,
+        "scores": scores,
+        "errors": errors,
+        "seconds": seconds,
+        "skipped": [name for name in order if name not in run],
+    }
+
+def ensemble_corpus(pairs, pooling=comparison.POOLING, stats=None, cache=None):
+    """Model-major early stopping: each model only scores the pairs that are still open."""
+    stats = load_stats() if stats is None else stats
+    order = model_order()
+    scores = {pair["bug_id"]: {} for pair in pairs}
+    verdicts = {}
+    calls = 0
+    for i, model_name in enumerate(order):
+        open_pairs = [pair for pair in pairs if pair["bug_id"] not in verdicts]
+        if not open_pairs:
+            break
+        calls += len(open_pairs)
+        texts = model_texts(open_pairs)
+        try:
+            with comparison.suppress_output():
+                model = comparison.semantic_models[model_name]()
+            embeddings, spans = corpus_scoring.encode_corpus(model, model_name, texts, cache, pooling)
+            model_scores = corpus_scoring.score_pairs(embeddings, spans[:len(open_pairs)], spans[len(open_pairs):], pooling)
+        except Exception as e:
+            print(f"⚠️ Error using model '{model_name}': {e}")
+            continue
+        model = None
+        for pair, score in zip(open_pairs, model_scores):
+            scores[pair["bug_id"]][model_name] = float(score)
+            verdict = settled_verdict(scores[pair["bug_id"]], order[i + 1:], stats)
+            if verdict is not None:
+                verdicts[pair["bug_id"]] = verdict
+    if cache is not None:
+        cache.flush()
+
+    skipped_fraction = 1 - calls / (len(pairs) * len(order)) if pairs else 0.0
+    return verdicts, scores, skipped_fraction
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Early-stopping ensemble over the semantic models.")
+    parser.add_argument("command", nargs="?", choices=["run", "calibrate"], default="run")
+    # An option, not a positional: argparse would hand a lone path to the optional command
+    parser.add_argument("--root", default=BUG_TESTS_ROOT, help="corpus folder (default: Bug Tests)")
+    args = parser.parse_args()
+
+    pairs = load_corpus(args.root)
+    if args.command == "calibrate":
+        stats = calibrate(corpus_scoring.score_corpus(pairs, cache=EmbeddingCache()))
+        for name, spread in stats.items():
+            print(f"→ [{name}]: deviation from the other models {spread['dev_low']:+.3f} .. {spread['dev_high']:+.3f}")
+    else:
+        verdicts, scores, skipped_fraction = ensemble_corpus(pairs, cache=EmbeddingCache())
+        for pair in pairs:
+            bug_id = pair["bug_id"]
+            bug_scores = scores[bug_id]
+            verdict = verdicts.get(bug_id)
+            mean = sum(bug_scores.values()) / len(bug_scores) if bug_scores else float("nan")
+            label = "✅ Match" if verdict else "❌ No Match" if verdict is not None else "⚠️ Undecided"
+            print(f"→ {bug_id}: {label} | mean {mean:.2f} after {len(bug_scores)} of {len(comparison.semantic_models)} models")
+        print(f"\nSkipped {skipped_fraction:.0%} of model calls")
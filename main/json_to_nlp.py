@@ -1,9 +1,5 @@
 import json
 
-# Load your changes.json
-with open("changes.json") as f:
-    changes = json.load(f)
-
 # Mapping rules
 def to_natural_language(change: dict) -> str:
     ctype = change.get("type")
@@ -30,16 +26,21 @@ def to_natural_language(change: dict) -> str:
 #     for change in func_changes:
 #         print(" -", to_natural_language(change))
 
+def render_nlp(changes: dict) -> str:
+    lines = []
+    for func, func_changes in changes.items():
+        lines.append(f"Function: {func}\n")
+        for change in func_changes:
+            lines.append(f"- {to_natural_language(change)}\n")
+        lines.append("\n")
+    return "".join(lines)
+
 def convert_json_to_nlp(json_file: str, output_file: str):
     with open(json_file) as f:
         changes = json.load(f)
 
     with open(output_file, "w") as out:
-        for func, func_changes in changes.items():
-            out.write(f"Function: {func}\n")
-            for change in func_changes:
-                out.write(f"- {to_natural_language(change)}\n")
-            out.write("\n")
+        out.write(render_nlp(changes))
 
 if __name__ == "__main__":
     convert_json_to_nlp("changes.json", "nlp_output.txt")
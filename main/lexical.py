@@ -0,0 +1,84 @@
+# lexical.py
+# Cheap lexical similarity between an explanation and an NLP summary, used as the first
+# stage of the comparison cascade. Identifiers are normalized so that `build_model_field`,
+# `buildModelField` and `build model field` all become the same tokens.
+import math
+import re
+from collections import Counter
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is", "it",
+    "its", "of", "on", "or", "that", "the", "this", "to", "was", "were", "with",
+}
+
+def normalize_tokens(text):
+    """Lowercase word tokens with snake_case and camelCase identifiers split into parts."""
+    tokens = []
+    for word in re.findall(r"[A-Za-z][A-Za-z0-9]*", text):
+        for part in re.findall(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+", word):
+            part = part.lower()
+            if part not in STOPWORDS:
+                tokens.append(part)
+    return tokens
+
+def jaccard(tokens_a, tokens_b):
+    set_a, set_b = set(tokens_a), set(tokens_b)
+    if not set_a and not set_b:
+        return 1.0
+    return len(set_a & set_b) / len(set_a | set_b)
+
+def tfidf_cosine(tokens_a, tokens_b, idf=None):
+    """Cosine of sublinear TF (times IDF when corpus statistics are given) vectors."""
+    counts_a, counts_b = Counter(tokens_a), Counter(tokens_b)
+    if not counts_a or not counts_b:
+        return 1.0 if counts_a == counts_b else 0.0
+
+    def weight(counts):
+        return {tok: (1 + math.log(n)) * (idf.get(tok, 1.0) if idf else 1.0) for tok, n in counts.items()}
+
+    weights_a, weights_b = weight(counts_a), weight(counts_b)
+    dot = sum(w * weights_b[tok] for tok, w in weights_a.items() if tok in weights_b)
+    norm = math.sqrt(sum(w * w for w in weights_a.values())) * math.sqrt(sum(w * w for w in weights_b.values()))
+    return min(1.0, dot / norm) if norm else 0.0
+
+def inverse_document_frequencies(documents):
+    """Smoothed IDF over token lists, for tfidf_cosine in corpus mode."""
+    frequencies = Counter(tok for tokens in documents for tok in set(tokens))
+    return {tok: math.log((1 + len(documents)) / (1 + n)) + 1 for tok, n in frequencies.items()}
+
+def lcs_length(tokens_a, tokens_b):
+    """Longest common subsequence length, bit-parallel (Hyyrö) so long texts stay fast."""
+    if not tokens_a or not tokens_b:
+        return 0
+    matches = {}
+    for i, tok in enumerate(tokens_a):
+        matches[tok] = matches.get(tok, 0) | (1 << i)
+    mask = (1 << len(tokens_a)) - 1
+    row = mask
+    for tok in tokens_b:
+        u = row & matches.get(tok, 0)
+        row = ((row + u) | (row - u)) & mask
+    return len(tokens_a) - bin(row).count("1")
+
+def rouge_l(tokens_a, tokens_b):
+    """ROUGE-L F1 over normalized tokens."""
+    if not tokens_a or not tokens_b:
+        return 1.0 if tokens_a == tokens_b else 0.0
+    lcs = lcs_length(tokens_a, tokens_b)
+    if lcs == 0:
+        return 0.0
+    precision, recall = lcs / len(tokens_b), lcs / len(tokens_a)
+    return 2 * precision * recall / (precision + recall)
+
+def lexical_scores(text_a, text_b, idf=None):
+    tokens_a, tokens_b = normalize_tokens(text_a), normalize_tokens(text_b)
+    return {
+        "jaccard": jaccard(tokens_a, tokens_b),
+        "tfidf": tfidf_cosine(tokens_a, tokens_b, idf),
+        "rouge_l": rouge_l(tokens_a, tokens_b),
+    }
+
+def lexical_score(text_a, text_b, idf=None):
+    """Single lexical similarity in [0, 1]: the mean of Jaccard, TF-IDF cosine and ROUGE-L."""
+    scores = lexical_scores(text_a, text_b, idf)
+    return sum(scores.values()) / len(scores)
@@ -0,0 +1,260 @@
+# llm_accounting.py
+# Token, cost and latency accounting for LLM calls. patchmaker and llm_pool record one row per
+# call (bug, model, prompt/completion tokens, time to first token, latency, retries, cache
+# hit) in a SQLite file; token counts come from the API's usage report when there is one and
+# from a local tokenizer otherwise (tiktoken if installed, else a characters-per-token guess).
+#
+#   python llm_accounting.py report [--run-id ID | --all]   # cost and latency over a run
+#   python llm_accounting.py estimate [--bug-tests]         # predicted tokens before sending anything
+#
+# LLM_ACCOUNTING=off disables recording.
+import argparse
+import os
+import sqlite3
+import statistics
+import time
+
+from run_id import RUN_ID
+
+USAGE_PATH = os.environ.get(
+    "LLM_USAGE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_usage", "usage.sqlite"),
+)
+ACCOUNTING = os.environ.get("LLM_ACCOUNTING", "on")
+CHARS_PER_TOKEN = 4  # fallback when tiktoken is not installed
+# USD per million (prompt, completion) tokens; models not listed are reported without a cost
+PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+BATCH_DISCOUNT = 0.5  # batch endpoints bill half the list price
+BATCH_SUFFIX = "+batch"  # appended to the mode of calls made through batch_jobs.py
+UNBILLED_BACKENDS = {"fake", "replay"}  # answered locally: no API call, no cost
+EXPLANATION_TOKENS = 250  # typical explanation after the code, for estimates without history
+EDIT_TOKENS = 200  # typical search/replace blocks for one bug
+MIN_HISTORY = 5  # recorded calls needed before estimates are calibrated from them
+
+COLUMNS = [
+    "run_id", "bug_id", "model", "mode", "prompt_tokens", "completion_tokens", "token_source",
+    "cached", "retries", "ttft", "latency", "error", "created", "backend",
+]
+
+_encodings = {}
+
+def count_tokens(text, model=None):
+    """(token count, source): exact with tiktoken when it knows the model, else estimated."""
+    try:
+        import tiktoken
+    except ImportError:
+        return len(text) // CHARS_PER_TOKEN, "estimate"
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("cl100k_base")
+    return len(_encodings[model].encode(text, disallowed_special=())), "tiktoken"
+
+def cost(model, prompt_tokens, completion_tokens, batch=False):
+    """USD for a call, or None for a model without a known price."""
+    if model not in PRICES:
+        return None
+    prompt_price, completion_price = PRICES[model]
+    total = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+    return total * BATCH_DISCOUNT if batch else total
+
+def call_record(bug_id, model, mode, prompt, response, usage, ttft, latency, cached=False, error=None,
+                backend="http"):
+    """One usage row; token counts the API did not report are counted locally."""
+    token_source = "api"
+    counts = {}
+    for key, text in (("prompt_tokens", prompt), ("completion_tokens", response or "")):
+        counts[key] = usage.get(key)
+        if counts[key] is None:
+            counts[key], token_source = count_tokens(text, model)
+    return {
+        "run_id": RUN_ID,
+        "bug_id": bug_id,
+        "model": model,
+        "mode": mode,
+        **counts,
+        "token_source": token_source,
+        "cached": cached,
+        "retries": usage.get("retries", 0),
+        "ttft": ttft,
+        "latency": latency,
+        "error": error,
+        "created": time.time(),
+        "backend": backend,
+    }
+
+class UsageStore:
+    def __init__(self, path=USAGE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")  # several run_all processes may share it
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS calls ("
+            " run_id TEXT, bug_id TEXT, model TEXT, mode TEXT, prompt_tokens INTEGER,"
+            " completion_tokens INTEGER, token_source TEXT, cached INTEGER, retries INTEGER,"
+            " ttft REAL, latency REAL, error TEXT, created REAL, backend TEXT)"
+        )
+        if "backend" not in [row[1] for row in self.db.execute("PRAGMA table_info(calls)")]:
+            # Stores created before backends were recorded only hold real API calls
+            self.db.execute("ALTER TABLE calls ADD COLUMN backend TEXT DEFAULT 'http'")
+        self.db.commit()
+
+    def record(self, row):
+        self.db.execute(
+            f"INSERT INTO calls ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+            [row[c] for c in COLUMNS],
+        )
+        self.db.commit()
+
+    def rows(self, run_id=None):
+        query, args = f"SELECT {', '.join(COLUMNS)} FROM calls", ()
+        if run_id is not None:
+            query, args = query + " WHERE run_id = ?", (run_id,)
+        return [dict(zip(COLUMNS, row)) for row in self.db.execute(query + " ORDER BY created", args)]
+
+    def latest_run(self):
+        row = self.db.execute("SELECT run_id FROM calls ORDER BY created DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.db.close()
+
+def open_store(mode=ACCOUNTING):
+    """The usage store, or None when LLM_ACCOUNTING=off."""
+    return None if mode == "off" else UsageStore()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else None
+
+def summarize(rows):
+    """Totals, cost and latency percentiles over usage rows; cache hits and fake/replayed calls cost nothing."""
+    unbilled = [row for row in rows if row["backend"] in UNBILLED_BACKENDS]
+    sent = [
+        row for row in rows
+        if not row["cached"] and row["error"] is None and row["backend"] not in UNBILLED_BACKENDS
+    ]
+    costs = [
+        cost(row["model"], row["prompt_tokens"], row["completion_tokens"], row["mode"].endswith(BATCH_SUFFIX))
+        for row in sent
+    ]
+    ttfts = [row["ttft"] for row in sent if row["ttft"] is not None]
+    latencies = [row["latency"] for row in sent if row["latency"] is not None]  # batch calls have none
+    per_bug = {}
+    for row in sent:
+        per_bug[row["bug_id"]] = per_bug.get(row["bug_id"], 0) + row["prompt_tokens"] + row["completion_tokens"]
+    return {
+        "calls": len(rows),
+        "cached": sum(bool(row["cached"]) for row in rows),
+        "unbilled": len(unbilled),
+        "errors": sum(row["error"] is not None for row in rows),
+        "retries": sum(row["retries"] for row in rows),
+        "prompt_tokens": sum(row["prompt_tokens"] for row in sent),
+        "completion_tokens": sum(row["completion_tokens"] for row in sent),
+        "estimated_tokens": any(row["token_source"] != "api" for row in sent),
+        "cost": sum(c for c in costs if c is not None),
+        "unpriced_calls": sum(c is None for c in costs),
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "ttft_p50": percentile(ttfts, 0.5),
+        "top_bugs": sorted(per_bug.items(), key=lambda item: -item[1])[:5],
+    }
+
+def format_seconds(seconds):
+    return f"{seconds:.2f}s" if seconds is not None else "-"
+
+def print_summary(summary, title):
+    print(f"📊 {title}: {summary['calls']} calls, {summary['cached']} from cache, "
+          f"{summary['errors']} failed, {summary['retries']} retries")
+    if summary["unbilled"]:
+        print(f"   {summary['unbilled']} calls answered by the fake or replay backend, not counted below")
+    note = " (partly counted locally)" if summary["estimated_tokens"] else ""
+    print(f"   tokens: {summary['prompt_tokens']:,} prompt + {summary['completion_tokens']:,} completion{note}")
+    unpriced = f" (+{summary['unpriced_calls']} calls to models without a price)" if summary["unpriced_calls"] else ""
+    print(f"   cost: ${summary['cost']:.2f}{unpriced}")
+    print(f"   latency: p50 {format_seconds(summary['latency_p50'])}, p95 {format_seconds(summary['latency_p95'])}, "
+          f"first token p50 {format_seconds(summary['ttft_p50'])}")
+    for bug_id, tokens in summary["top_bugs"]:
+        print(f"   {tokens:>8,} tokens  {bug_id}")
+
+def completion_ratio(store, model, mode):
+    """Median completion/prompt token ratio of recorded calls, or None without enough history."""
+    rows = [
+        row for row in (store.rows() if store else [])
+        if row["model"] == model and row["mode"] == mode and not row["cached"]
+        and row["error"] is None and row["prompt_tokens"] and row["backend"] not in UNBILLED_BACKENDS
+    ]
+    if len(rows) < MIN_HISTORY:
+        return None
+    return statistics.median(row["completion_tokens"] / row["prompt_tokens"] for row in rows)
+
+def estimate_corpus(sources, mode, model, store=None):
+    """{bug: (prompt tokens, predicted completion tokens)} for {bug: (source, is_excerpt)}.
+
+    Prompt tokens are counted exactly from the prompt that would be sent. Completions are
+    predicted from the recorded completion/prompt ratio for the model and mode, or else as
+    the code (full mode) or a few edit blocks (edits mode) plus an explanation.
+    """
+    import patchmaker
+    ratio = completion_ratio(store, model, mode)
+    estimates = {}
+    for bug_id, (source, excerpt) in sources.items():
+        prompt_tokens = count_tokens(patchmaker.build_prompt(source, excerpt, mode), model)[0]
+        if ratio is not None:
+            completion_tokens = round(ratio * prompt_tokens)
+        elif mode == "full":
+            completion_tokens = count_tokens(source, model)[0] + EXPLANATION_TOKENS
+        else:
+            completion_tokens = EDIT_TOKENS + EXPLANATION_TOKENS
+        estimates[bug_id] = (prompt_tokens, completion_tokens)
+    return estimates
+
+def corpus_sources(bug_tests=False, use_slicing=True):
+    """{bug: (prompt source, is_excerpt)} for the BugsInPy sweep or the Bug Tests."""
+    import context_slicer
+    if bug_tests:
+        import bench_pipeline
+        return {
+            name: context_slicer.excerpt_for_bug(buggy, bench_pipeline.unified_diff(buggy, fixed))
+            if use_slicing else (buggy, False)
+            for name, (buggy, fixed, _) in bench_pipeline.load_bug_tests().items()
+        }
+    import run_all
+    return {
+        f"{project}/{bug}": run_all.prompt_source(path, patch_file, modified, use_slicing)
+        for project, bug, path, patch_file, modified in run_all.find_bugs()
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM token, cost and latency accounting.")
+    parser.add_argument("command", choices=["report", "estimate"])
+    parser.add_argument("--run-id", help="report on this run (default: the latest)")
+    parser.add_argument("--all", action="store_true", help="report on every recorded call")
+    parser.add_argument("--bug-tests", action="store_true", help="estimate for main/Bug Tests instead of all_bugs")
+    parser.add_argument("--no-slicing", action="store_true", help="estimate for whole files instead of excerpts")
+    parser.add_argument("--response-mode", choices=["edits", "full"], default=None)
+    args = parser.parse_args()
+
+    store = UsageStore() if os.path.exists(USAGE_PATH) or args.command == "report" else None
+    if args.command == "report":
+        run_id = None if args.all else args.run_id or store.latest_run()
+        print_summary(summarize(store.rows(run_id)), "all runs" if args.all else f"run {run_id}")
+    else:
+        import patchmaker
+        mode = args.response_mode or patchmaker.RESPONSE_MODE
+        estimates = estimate_corpus(corpus_sources(args.bug_tests, not args.no_slicing), mode, patchmaker.MODEL, store)
+        prompt_total = sum(p for p, _ in estimates.values())
+        completion_total = sum(c for _, c in estimates.values())
+        print(f"🔮 {len(estimates)} bugs, {mode} mode, {patchmaker.MODEL}: ~{prompt_total:,} prompt + "
+              f"~{completion_total:,} completion tokens")
+        predicted = cost(patchmaker.MODEL, prompt_total, completion_total)
+        if predicted is not None:
+            print(f"   ~${predicted:.2f} at list price")
@@ -0,0 +1,282 @@
+# llm_backends.py
+# Where patchmaker's completions come from, selected with LLM_BACKEND:
+#   http    any OpenAI-compatible /chat/completions endpoint (OpenAI, llama.cpp, vLLM, ...)
+#   fake    ScriptedBackend: canned responses, no network
+#   record  http, and every exchange is saved as a JSON fixture in LLM_FIXTURES_DIR
+#   replay  answers only from those fixtures (a missing one raises FixtureMissing)
+#
+# Every backend has complete(prompt, params, on_text=None, usage=None) -> response text; with
+# on_text the response is streamed and on_text gets each piece as it arrives. A usage dict is
+# filled with whatever the backend knows: prompt_tokens, completion_tokens, retries.
+# candidates(prompt, params, n, usage=None) -> n response texts from one request (n=k), so
+# the prompt is only paid for once. `name` is the LLM_BACKEND name the backend stands for and
+# `billable` whether its responses come from (and are paid to) the real API: responses of
+# fake and replay backends are cached apart from real ones and are not priced.
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import urllib.error
+import urllib.request
+
+BACKEND = os.environ.get("LLM_BACKEND", "http")
+BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+API_KEY = os.environ.get("OPENAI_API_KEY", "")
+MODEL = os.environ.get("LLM_MODEL", "gpt-4")
+FIXTURES_DIR = os.environ.get(
+    "LLM_FIXTURES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_fixtures"),
+)
+REQUEST_TIMEOUT = 600  # seconds for one completion
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 6))
+BACKOFF_BASE = 1.0  # seconds; doubles per attempt
+BACKOFF_MAX = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REPLAY_CHUNK_CHARS = 64  # fake and replayed responses are streamed in pieces of this size
+
+class BackendError(Exception):
+    """The backend could not produce a completion."""
+
+class FixtureMissing(BackendError, LookupError):
+    """Replay mode was asked for an exchange that was never recorded."""
+
+class RetryableError(Exception):
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+def retry_after_seconds(headers):
+    """Server-requested wait from Retry-After / retry-after-ms, if any."""
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "Retry-After" in headers:
+            return float(headers["Retry-After"])
+    except ValueError:
+        pass  # HTTP-date form; fall back to our own backoff
+    return None
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than what the server asked for."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+def fill_usage(usage, reported):
+    """Copy the API's token counts into the caller's usage dict."""
+    if usage is not None and reported:
+        for key in ("prompt_tokens", "completion_tokens"):
+            if reported.get(key) is not None:
+                usage[key] = reported[key]
+
+def stream_text(text, on_text, chunk_chars=REPLAY_CHUNK_CHARS, delay=0.0):
+    """Hand text to on_text in fixed-size pieces, like a streamed completion."""
+    for start in range(0, len(text), chunk_chars):
+        if delay:
+            time.sleep(delay)
+        on_text(text[start:start + chunk_chars])
+
+class HTTPBackend:
+    """OpenAI-compatible chat completions over plain HTTP (no client library needed)."""
+
+    name = "http"
+    billable = True
+
+    def __init__(self, base_url=BASE_URL, api_key=API_KEY, model=MODEL, timeout=REQUEST_TIMEOUT,
+                 max_retries=MAX_RETRIES):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def send(self, payload):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode("utf-8"), headers=headers)
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code in RETRY_STATUSES:
+                raise RetryableError(e.code, retry_after_seconds(e.headers)) from e
+            raise BackendError(f"HTTP {e.code} from {self.url}: {e.read()[:200]!r}") from e
+
+    def request(self, prompt, params, stream, usage=None):
+        """Open the response, retrying 429/5xx and connection errors with backoff."""
+        payload = {"model": self.model, "messages": [{"role": "user", "content": prompt}], **params}
+        if stream:
+            # OpenAI only reports usage for streams when asked; other servers ignore the option
+            payload.update(stream=True, stream_options={"include_usage": True})
+        for attempt in range(self.max_retries + 1):
+            if usage is not None:
+                usage["retries"] = attempt
+            try:
+                return self.send(payload)
+            except (RetryableError, urllib.error.URLError, OSError) as e:
+                if attempt == self.max_retries:
+                    raise BackendError(f"{self.url}: gave up after {attempt + 1} attempts: {e}") from e
+                time.sleep(backoff_delay(attempt, getattr(e, "retry_after", None)))
+
+    def complete(self, prompt, params, on_text=None, usage=None):
+        if on_text is None:
+            with self.request(prompt, params, False, usage) as response:
+                body = json.load(response)
+            fill_usage(usage, body.get("usage"))
+            return body["choices"][0]["message"]["content"]
+
+        # Server-sent events: "data: {chunk json}" lines, terminated by "data: [DONE]"
+        parts = []
+        with self.request(prompt, params, True, usage) as response:
+            for raw_line in response:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                fill_usage(usage, chunk.get("usage"))  # the last chunk, when usage was requested
+                choices = chunk.get("choices") or [{}]
+                text = choices[0].get("delta", {}).get("content") or ""
+                if text:
+                    parts.append(text)
+                    on_text(text)
+        return "".join(parts)
+
+    def candidates(self, prompt, params, n, usage=None):
+        texts = []
+        # Servers that ignore n (llama.cpp, ...) answer with one choice; ask again for the rest
+        for _ in range(n):
+            request_usage = {}
+            with self.request(prompt, {**params, "n": n - len(texts)}, False, request_usage) as response:
+                body = json.load(response)
+            if usage is not None:
+                for key, value in (body.get("usage") or {}).items():
+                    if key in ("prompt_tokens", "completion_tokens"):
+                        usage[key] = usage.get(key, 0) + value
+                usage["retries"] = usage.get("retries", 0) + request_usage.get("retries", 0)
+            texts += [choice["message"]["content"] for choice in sorted(body["choices"], key=lambda c: c.get("index", 0))]
+            if len(texts) >= n:
+                break
+        return texts[:n]
+
+def echo_responder(prompt):
+    """Return the prompt's code unchanged as the 'fix' (in the format patchmaker asks for)."""
+    match = re.search(r"Code:\n(.*)", prompt, flags=re.DOTALL)
+    code = match.group(1).strip() if match else ""
+    explanation = "---EXPLANATION---\nScripted response: the code was returned unchanged."
+    if "<<<<<<< SEARCH" in prompt:
+        first_line = code.splitlines()[0] if code else ""
+        return f"<<<<<<< SEARCH\n{first_line}\n=======\n{first_line}\n>>>>>>> REPLACE\n{explanation}"
+    return f"```python\n{code}\n```\n{explanation}"
+
+class ScriptedBackend:
+    """Canned responses: a responder(prompt) -> text callable, or a list answered in order."""
+
+    name = "fake"
+    billable = False
+
+    def __init__(self, responder=echo_responder, model=MODEL, chunk_delay=0.0):
+        if isinstance(responder, (list, tuple)):
+            responses = iter(responder)
+            responder = lambda prompt: next(responses)  # noqa: E731
+        self.responder = responder
+        self.model = model
+        self.chunk_delay = chunk_delay  # seconds per streamed piece, to simulate generation time
+
+    def complete(self, prompt, params, on_text=None, usage=None):
+        try:
+            text = self.responder(prompt)
+        except StopIteration:
+            raise BackendError("scripted backend ran out of responses")
+        if on_text is not None:
+            stream_text(text, on_text, delay=self.chunk_delay)
+        return text
+
+    def candidates(self, prompt, params, n, usage=None):
+        return [self.complete(prompt, params) for _ in range(n)]
+
+def exchange_key(model, prompt, params):
+    key = json.dumps({"model": model, "prompt": prompt, "params": params}, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+class RecordReplayBackend:
+    """Records the exchanges of an inner backend as fixtures, or replays them without it."""
+
+    def __init__(self, inner=None, fixtures_dir=FIXTURES_DIR, model=MODEL, record=False):
+        self.inner = inner
+        self.fixtures_dir = fixtures_dir
+        self.model = inner.model if inner is not None else model
+        self.record = record
+        self.name = "record" if record else "replay"
+        self.billable = record  # recording goes through the real API
+
+    def fixture_path(self, prompt, params):
+        return os.path.join(self.fixtures_dir, f"{exchange_key(self.model, prompt, params)}.json")
+
+    def replay(self, prompt, params, usage):
+        path = self.fixture_path(prompt, params)
+        try:
+            with open(path, encoding="utf-8") as f:
+                fixture = json.load(f)
+        except OSError:
+            raise FixtureMissing(f"no recorded exchange {os.path.basename(path)} in {self.fixtures_dir}")
+        fill_usage(usage, fixture.get("usage"))
+        return fixture["response"]
+
+    def save(self, prompt, params, response, usage, seconds):
+        path = self.fixture_path(prompt, params)
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "model": self.model,
+                "params": params,
+                "prompt": prompt,
+                "response": response,
+                "usage": {key: usage.get(key) for key in ("prompt_tokens", "completion_tokens")},
+                "seconds": round(seconds, 3),
+            }, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def complete(self, prompt, params, on_text=None, usage=None):
+        if not self.record:
+            text = self.replay(prompt, params, usage)
+            if on_text is not None:
+                stream_text(text, on_text)
+            return text
+
+        start = time.perf_counter()
+        recorded_usage = {}
+        text = self.inner.complete(prompt, params, on_text, recorded_usage)
+        if usage is not None:
+            usage.update(recorded_usage)
+        self.save(prompt, params, text, recorded_usage, time.perf_counter() - start)
+        return text
+
+    def candidates(self, prompt, params, n, usage=None):
+        # n is part of the fixture key: a k-candidate exchange is recorded as one response list
+        if not self.record:
+            return self.replay(prompt, {**params, "n": n}, usage)
+        start = time.perf_counter()
+        recorded_usage = {}
+        texts = self.inner.candidates(prompt, params, n, recorded_usage)
+        if usage is not None:
+            usage.update(recorded_usage)
+        self.save(prompt, {**params, "n": n}, texts, recorded_usage, time.perf_counter() - start)
+        return texts
+
+def get_backend(name=BACKEND):
+    """Backend for an LLM_BACKEND name."""
+    if name == "http":
+        return HTTPBackend()
+    if name == "fake":
+        return ScriptedBackend()
+    if name == "record":
+        return RecordReplayBackend(HTTPBackend(), record=True)
+    if name == "replay":
+        return RecordReplayBackend()
+    raise ValueError(f"LLM_BACKEND must be http, fake, record or replay, not '{name}'")
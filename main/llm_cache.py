@@ -0,0 +1,135 @@
+# llm_cache.py
+# Persistent cache of LLM responses keyed by (model, prompt template version, buggy-source
+# hash, request parameters), stored in one SQLite file. Only temperature-0 requests are
+# cached, since those are the ones a re-run would answer the same way. Responses of
+# non-billable backends (fake, replay) also carry the backend name in their key, so they
+# are never served to a real run.
+#
+# LLM_CACHE_MODE=readwrite (default) | readonly | off
+#   readonly never writes and raises CacheMiss instead of calling the API, so a benchmark
+#   run is guaranteed to replay exactly the responses already recorded.
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache", "responses.sqlite"),
+)
+CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "readwrite")
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 90 * 24 * 3600))  # seconds; 0 = never expire
+MAX_CACHE_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+class CacheMiss(LookupError):
+    """Raised in read-only mode when a response is not in the cache."""
+
+def source_hash(source):
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+def cache_key(model, prompt_version, source, params, backend=None):
+    """backend: name of a non-billable backend; None for real API responses (their keys predate it)."""
+    fields = {"model": model, "prompt_version": prompt_version, "source": source_hash(source), "params": params}
+    if backend is not None:
+        fields["backend"] = backend
+    key = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def cacheable(params):
+    return params.get("temperature", 1) == 0
+
+class LLMCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=MAX_CACHE_BYTES, read_only=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        if read_only:
+            # mode=ro fails loudly if there is no cache to replay from
+            self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(path, timeout=30)
+            self.db.execute("PRAGMA journal_mode=WAL")  # several run_all processes may share it
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, prompt_version TEXT, source_hash TEXT,"
+                " params TEXT, response TEXT, bytes INTEGER, created REAL, last_used REAL)"
+            )
+            self.db.commit()
+
+    def expired(self, created):
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def get(self, model, prompt_version, source, params, backend=None):
+        """Return the cached response text or None (raises CacheMiss in read-only mode)."""
+        key = cache_key(model, prompt_version, source, params, backend)
+        row = self.db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and not self.expired(row[1]):
+            if not self.read_only:
+                self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.db.commit()
+            return row[0]
+        if self.read_only:
+            raise CacheMiss(f"no cached response for {backend or model} / prompt v{prompt_version} / {source_hash(source)[:12]}")
+        return None
+
+    def put(self, model, prompt_version, source, params, response, backend=None):
+        if self.read_only or not cacheable(params):
+            return
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (cache_key(model, prompt_version, source, params, backend), model, str(prompt_version),
+             source_hash(source), json.dumps(params, sort_keys=True), response,
+             len(response.encode("utf-8")), now, now),
+        )
+        self.db.commit()
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until the cache fits in max_bytes."""
+        if self.read_only:
+            return
+        if self.ttl > 0:
+            self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        total = self.db.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()[0]
+        if total > self.max_bytes:
+            rows = self.db.execute("SELECT key, bytes FROM responses ORDER BY last_used").fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+        self.db.commit()
+
+    def stats(self):
+        count, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM responses").fetchone()
+        return {"entries": count, "bytes": total}
+
+    def close(self):
+        self.db.close()
+
+def open_cache(mode=CACHE_MODE):
+    """The cache for LLM_CACHE_MODE, or None when caching is off."""
+    if mode == "off":
+        return None
+    if mode not in ("readwrite", "readonly"):
+        raise ValueError(f"LLM_CACHE_MODE must be readwrite, readonly or off, not '{mode}'")
+    return LLMCache(read_only=mode == "readonly")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or trim the LLM response cache.")
+    parser.add_argument("command", choices=["stats", "evict", "clear"])
+    args = parser.parse_args()
+
+    cache = LLMCache()
+    if args.command == "clear":
+        cache.db.execute("DELETE FROM responses")
+        cache.db.commit()
+    elif args.command == "evict":
+        cache.evict()
+    stats = cache.stats()
+    print(f"🗄️ {stats['entries']} cached responses, {stats['bytes'] / 1024:.0f} KiB in {cache.path}")
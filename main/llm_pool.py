@@ -0,0 +1,236 @@
+# llm_pool.py
+# Async patch generation: many fix-and-explain requests in flight at once against an
+# OpenAI-compatible /chat/completions endpoint, with bounded concurrency, token-bucket rate
+# limiting (requests and tokens per minute) and jittered exponential backoff on 429/5xx.
+#
+# Try it against the local stub:
+#   python llm_stub_server.py --rpm 60 --error-rate 0.2 &
+#   OPENAI_BASE_URL=http://127.0.0.1:8766/v1 python llm_pool.py code1.py "Bug Tests/Test 1/bug.py"
+import argparse
+import asyncio
+import os
+import time
+
+import aiohttp
+
+import llm_accounting
+import llm_cache
+import patchmaker
+from llm_backends import (
+    MAX_RETRIES, RETRY_STATUSES, RetryableError, backoff_delay, fill_usage, retry_after_seconds,
+)
+
+BASE_URL = os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1")
+API_KEY = os.environ.get("OPENAI_API_KEY", "")
+CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", 8))
+REQUESTS_PER_MINUTE = float(os.environ.get("LLM_RPM", 500))
+TOKENS_PER_MINUTE = float(os.environ.get("LLM_TPM", 40000))
+REQUEST_TIMEOUT = 600  # seconds for one completion
+CHARS_PER_TOKEN = 4  # rough estimate, good enough to pace against a tokens-per-minute limit
+
+class LLMRequestError(Exception):
+    """A completion failed for good (non-retryable status or retries exhausted)."""
+
+def estimate_tokens(prompt):
+    """Prompt plus completion tokens; the fixed code is about as long as the code sent."""
+    return 2 * len(prompt) // CHARS_PER_TOKEN
+
+class TokenBucket:
+    """Refills at per_minute / 60 units per second up to one minute's worth."""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+        # Waiters queue on the lock, so a large request is not starved by small ones
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        amount = min(amount, self.capacity)  # an oversized request must still be able to go
+        async with self.lock:
+            self.refill()
+            while self.level < amount:
+                await asyncio.sleep((amount - self.level) / self.rate)
+                self.refill()
+            self.level -= amount
+
+    def adjust(self, amount):
+        """Correct an estimate once the real usage is known (negative amounts refund)."""
+        self.refill()
+        self.level = min(self.capacity, self.level - amount)
+
+class LLMPool:
+    def __init__(self, base_url=BASE_URL, api_key=API_KEY, model=patchmaker.MODEL,
+                 concurrency=CONCURRENCY, requests_per_minute=REQUESTS_PER_MINUTE,
+                 tokens_per_minute=TOKENS_PER_MINUTE, max_retries=MAX_RETRIES):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.max_retries = max_retries
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        # After a 429 every request waits, not just the one that was rejected
+        self.resume_at = 0.0
+        self.session = None
+
+    async def __aenter__(self):
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        self.session = aiohttp.ClientSession(
+            headers=headers, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def post(self, payload):
+        async with self.session.post(self.url, json=payload) as response:
+            if response.status in RETRY_STATUSES:
+                raise RetryableError(response.status, retry_after_seconds(response.headers))
+            if response.status >= 400:
+                text = await response.text()
+                raise LLMRequestError(f"HTTP {response.status}: {text[:200]}")
+            return await response.json()
+
+    async def complete(self, prompt, usage=None, **params):
+        """Send one chat completion and return the message content, retrying transient errors.
+
+        usage, if given, is filled with the reported token counts and the number of retries.
+        """
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            **patchmaker.PARAMS,
+            **params,
+        }
+        estimate = estimate_tokens(prompt)
+        for attempt in range(self.max_retries + 1):
+            if usage is not None:
+                usage["retries"] = attempt
+            wait = self.resume_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with self.semaphore:
+                    await self.requests.acquire()
+                    await self.tokens.acquire(estimate)
+                    body = await self.post(payload)
+            except (RetryableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == self.max_retries:
+                    raise LLMRequestError(f"gave up after {attempt + 1} attempts: {e}") from e
+                delay = backoff_delay(attempt, getattr(e, "retry_after", None))
+                if getattr(e, "status", None) == 429:
+                    self.resume_at = max(self.resume_at, time.monotonic() + delay)
+                await asyncio.sleep(delay)
+                continue
+
+            fill_usage(usage, body.get("usage"))
+            used = body.get("usage", {}).get("total_tokens")
+            if used is not None:
+                self.tokens.adjust(used - estimate)
+            return body["choices"][0]["message"]["content"]
+
+async def generate_patches(codes, timeout=None, on_result=None, cache=None, excerpts=(), mode="full",
+                           accounting=None, bug_ids=None, **pool_options):
+    """Run fix-and-explain for {key: buggy_code}; returns {key: response text or LLMRequestError}.
+
+    Keys in excerpts hold a context_slicer excerpt rather than a whole file and get the
+    excerpt prompt; mode is the patchmaker response mode ("edits" or "full").
+
+    Cached responses (llm_cache.py) are returned without a request; in read-only cache mode a
+    miss is reported as an error. Keys still running after timeout seconds are cancelled and
+    reported as errors. Cancelling the caller (e.g. Ctrl-C under asyncio.run) cancels every
+    request in flight.
+
+    Every call is recorded in the usage store (llm_accounting.py) under bug_ids[key], or the
+    key itself; accounting=False turns that off.
+    """
+    cache = cache or llm_cache.open_cache()
+    if accounting is None:
+        accounting = llm_accounting.open_store()
+    async with LLMPool(**pool_options) as pool:
+        async def fix_one(key, buggy_code):
+            excerpt = key in excerpts
+            version = patchmaker.prompt_version(excerpt, mode)
+            prompt = patchmaker.build_prompt(buggy_code, excerpt, mode)
+            usage, cached, start = {}, False, time.perf_counter()
+            try:
+                result = cache.get(pool.model, version, buggy_code, patchmaker.PARAMS) if cache else None
+                cached = result is not None
+                if result is None:
+                    result = await pool.complete(prompt, usage)
+                    if cache is not None:
+                        cache.put(pool.model, version, buggy_code, patchmaker.PARAMS, result)
+            except llm_cache.CacheMiss as e:
+                result = LLMRequestError(str(e))
+            except LLMRequestError as e:
+                result = e
+            except Exception as e:
+                # e.g. a malformed response body: this bug fails, the sweep goes on
+                result = LLMRequestError(f"{type(e).__name__}: {e}")
+            if accounting:
+                failed = isinstance(result, LLMRequestError)
+                accounting.record(llm_accounting.call_record(
+                    (bug_ids or {}).get(key, key), pool.model, mode, prompt, None if failed else result,
+                    usage, None, time.perf_counter() - start, cached, str(result) if failed else None,
+                ))
+            if on_result is not None:
+                on_result(key, result)
+            return key, result
+
+        tasks = {key: asyncio.create_task(fix_one(key, code)) for key, code in codes.items()}
+        try:
+            await asyncio.wait(tasks.values(), timeout=timeout)
+        finally:
+            pending = [task for task in tasks.values() if not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        results = {}
+        for key, task in tasks.items():
+            if task.cancelled():
+                results[key] = LLMRequestError("cancelled")
+            elif task.exception() is not None:
+                # Raised outside the request itself (usage store, on_result callback)
+                results[key] = LLMRequestError(f"{type(task.exception()).__name__}: {task.exception()}")
+            else:
+                results[key] = task.result()[1]
+        return results
+
+def run_patches(codes, **options):
+    """Blocking wrapper around generate_patches for scripts like run_all.py."""
+    return asyncio.run(generate_patches(codes, **options))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate fixes for several files concurrently.")
+    parser.add_argument("files", nargs="+", help="buggy source files")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=None, help="give up on the whole sweep after N seconds")
+    args = parser.parse_args()
+
+    codes = {}
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as f:
+            codes[path] = f.read()
+
+    def report(path, result):
+        if isinstance(result, LLMRequestError):
+            print(f"❌ {path}: {result}")
+        else:
+            print(f"✅ {path}: {len(result)} chars")
+
+    start = time.perf_counter()
+    results = run_patches(codes, timeout=args.timeout, on_result=report, concurrency=args.concurrency)
+    for path, result in results.items():
+        if str(result) == "cancelled":
+            print(f"🛑 {path}: cancelled")
+    failed = sum(isinstance(result, LLMRequestError) for result in results.values())
+    print(f"⏱️ {len(results) - failed}/{len(results)} done in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,264 @@
+# llm_stub_server.py
+# Local stand-in for an OpenAI-compatible /v1/chat/completions endpoint, for exercising
+# llm_pool.py and llm_backends.HTTPBackend without an API key: simulated latency, streamed
+# (stream=true) or whole responses, a requests-per-minute limit answered with 429 +
+# Retry-After, and randomly injected 429/5xx errors. It also implements the files and batches
+# endpoints batch_jobs.py uses (/v1/files, /v1/batches), working through each batch in the
+# background at --batch-latency seconds per request; injected errors land in the error file.
+#
+#   python llm_stub_server.py --latency 1.0 --rpm 60 --error-rate 0.1
+#   OPENAI_BASE_URL=http://127.0.0.1:8766/v1 python llm_pool.py ...
+# GET /stats reports how many requests were served, rejected and in flight at most.
+import argparse
+import collections
+import itertools
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import llm_backends
+
+STUB_HOST = "127.0.0.1"
+STUB_PORT = 8766
+CHARS_PER_TOKEN = 4
+
+class StubState:
+    def __init__(self, latency, rpm, error_rate, batch_latency=0.01):
+        self.latency = latency
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.batch_latency = batch_latency
+        self.lock = threading.Lock()
+        self.files = {}  # file id -> bytes
+        self.batches = {}  # batch id -> batch object
+        self.ids = itertools.count(1)
+        self.accepted = collections.deque()  # arrival times within the last minute
+        self.stats = {"served": 0, "rate_limited": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def admit(self):
+        """Return the Retry-After seconds if the request is over the per-minute limit."""
+        with self.lock:
+            now = time.monotonic()
+            while self.accepted and now - self.accepted[0] >= 60:
+                self.accepted.popleft()
+            if self.rpm and len(self.accepted) >= self.rpm:
+                self.stats["rate_limited"] += 1
+                return 60 - (now - self.accepted[0])
+            self.accepted.append(now)
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            return None
+
+    def finish(self, key):
+        with self.lock:
+            self.stats["in_flight"] -= 1
+            self.stats[key] += 1
+
+    def new_id(self, prefix):
+        with self.lock:
+            return f"{prefix}-{next(self.ids)}"
+
+    def add_file(self, content):
+        file_id = self.new_id("file")
+        with self.lock:
+            self.files[file_id] = content
+        return file_id
+
+    def run_batch(self, batch_id):
+        """Answer every request of a batch, then publish the output and error files."""
+        batch = self.batches[batch_id]
+        lines = [json.loads(line) for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines() if line.strip()]
+        batch.update(status="in_progress", request_counts={"total": len(lines), "completed": 0, "failed": 0})
+        outputs, errors = [], []
+        for line in lines:
+            if batch["status"] == "cancelling":
+                break
+            time.sleep(self.batch_latency)
+            item = {"id": self.new_id("batch_req"), "custom_id": line["custom_id"], "error": None}
+            if random.random() < self.error_rate:
+                item["response"] = {"status_code": 500, "body": {"error": {"message": "injected failure"}}}
+                errors.append(item)
+                batch["request_counts"]["failed"] += 1
+            else:
+                item["response"] = {"status_code": 200, "body": completion_body(line["body"])}
+                outputs.append(item)
+                batch["request_counts"]["completed"] += 1
+        for key, items in (("output_file_id", outputs), ("error_file_id", errors)):
+            if items:
+                batch[key] = self.add_file("".join(json.dumps(item) + "\n" for item in items).encode("utf-8"))
+        batch["status"] = "cancelled" if batch["status"] == "cancelling" else "completed"
+
+def completion_body(request):
+    """A chat.completion answering a request body, with the echo responder (n choices)."""
+    prompt = request["messages"][-1]["content"]
+    content = llm_backends.echo_responder(prompt)
+    n = request.get("n", 1)
+    return {
+        "object": "chat.completion",
+        "model": request.get("model", "stub"),
+        "choices": [
+            {"index": i, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+            for i in range(n)
+        ],
+        "usage": {
+            "prompt_tokens": len(prompt) // CHARS_PER_TOKEN,
+            "completion_tokens": n * len(content) // CHARS_PER_TOKEN,
+            "total_tokens": (len(prompt) + n * len(content)) // CHARS_PER_TOKEN,
+        },
+    }
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model, content, usage=None):
+        """Server-sent events in the chat.completion.chunk format, ending with [DONE].
+
+        With usage, a last chunk without choices reports it, as OpenAI does for include_usage.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [content[i:i + llm_backends.REPLAY_CHUNK_CHARS]
+                  for i in range(0, len(content), llm_backends.REPLAY_CHUNK_CHARS)]
+        for piece in pieces:
+            chunk = {"object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        if usage is not None:
+            chunk = {"object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if self.path == "/stats":
+            with self.state.lock:
+                self._send_json(200, dict(self.state.stats))
+        elif parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in self.state.batches:
+            self._send_json(200, self.state.batches[parts[2]])
+        elif parts[:2] == ["v1", "files"] and parts[3:] == ["content"] and parts[2] in self.state.files:
+            content = self.state.files[parts[2]]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/jsonl")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def upload_file(self, body):
+        """POST /v1/files: multipart/form-data with 'purpose' and 'file' fields."""
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+        )
+        fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+                  for part in message.iter_parts()}
+        if "file" not in fields:
+            self._send_json(400, {"error": "missing file"})
+            return
+        file_id = self.state.add_file(fields["file"])
+        self._send_json(200, {"id": file_id, "object": "file", "bytes": len(fields["file"]),
+                              "purpose": (fields.get("purpose") or b"").decode("utf-8")})
+
+    def create_batch(self, request):
+        """POST /v1/batches: start working through the uploaded input file."""
+        if request.get("input_file_id") not in self.state.files:
+            self._send_json(400, {"error": "unknown input_file_id"})
+            return
+        batch_id = self.state.new_id("batch")
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": request.get("endpoint"),
+            "input_file_id": request["input_file_id"], "status": "validating",
+            "output_file_id": None, "error_file_id": None, "created_at": int(time.time()),
+            "metadata": request.get("metadata") or {}, "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        self.state.batches[batch_id] = batch
+        threading.Thread(target=self.state.run_batch, args=(batch_id,), daemon=True).start()
+        self._send_json(200, batch)
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path == "/v1/files":
+            self.upload_file(body)
+            return
+        if parts[:2] == ["v1", "batches"] and parts[3:] == ["cancel"] and parts[2] in self.state.batches:
+            batch = self.state.batches[parts[2]]
+            if batch["status"] not in ("completed", "cancelled"):
+                batch["status"] = "cancelling"
+            self._send_json(200, batch)
+            return
+        if self.path not in ("/v1/chat/completions", "/v1/batches"):
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            request = json.loads(body)
+            if self.path == "/v1/batches":
+                self.create_batch(request)
+                return
+            prompt = request["messages"][-1]["content"]
+        except (ValueError, KeyError, IndexError) as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+            return
+
+        retry_after = self.state.admit()
+        if retry_after is not None:
+            self._send_json(429, {"error": "rate limited"}, {"Retry-After": f"{retry_after:.2f}"})
+            return
+
+        time.sleep(random.uniform(0.5, 1.5) * self.state.latency)
+        if random.random() < self.state.error_rate:
+            self.state.finish("errors")
+            status = random.choice([429, 500, 503])
+            self._send_json(status, {"error": "injected failure"})
+            return
+
+        completion = completion_body(request)
+        self.state.finish("served")
+        if request.get("stream"):
+            include_usage = (request.get("stream_options") or {}).get("include_usage")
+            content = completion["choices"][0]["message"]["content"]
+            self._send_stream(completion["model"], content, completion["usage"] if include_usage else None)
+            return
+        self._send_json(200, completion)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host=STUB_HOST, port=STUB_PORT, latency=0.5, rpm=0, error_rate=0.0, batch_latency=0.01):
+    StubHandler.state = StubState(latency, rpm, error_rate, batch_latency)
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    print(f"🧪 LLM stub listening on http://{host}:{port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub for llm_pool.py, llm_backends.py and batch_jobs.py.")
+    parser.add_argument("--port", type=int, default=STUB_PORT)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per completion")
+    parser.add_argument("--rpm", type=int, default=0, help="requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 429/5xx")
+    parser.add_argument("--batch-latency", type=float, default=0.01, help="seconds per request inside a batch")
+    args = parser.parse_args()
+    serve(port=args.port, latency=args.latency, rpm=args.rpm, error_rate=args.error_rate,
+          batch_latency=args.batch_latency)
@@ -0,0 +1,175 @@
+# model_manager.py
+# Model lifecycle under an RSS budget: models are loaded on demand, the most valuable ones
+# stay resident while they fit, and the rest are released explicitly (including allocator
+# caches) instead of waiting for garbage collection. Peak RSS is logged per stage.
+# Where RSS cannot be measured (no /proc and no `resource`, e.g. Windows) sizes are reported
+# as unknown and the budget is not enforced.
+import contextlib
+import ctypes
+import gc
+import os
+import sys
+import time
+from collections import OrderedDict
+
+def total_memory():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 8 * 1024 ** 3
+
+RSS_BUDGET = int(os.environ.get("MODEL_RSS_BUDGET", total_memory() // 2))
+BYTES_PER_COST = 4 * 1.5 * 1e6  # float32 weights of a MODEL_COSTS unit (1M params) plus runtime overhead
+
+def current_rss():
+    """Resident set size of this process in bytes, or None where it cannot be measured."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return peak_rss()
+
+def peak_rss():
+    """Peak RSS in bytes since the last reset_peak_rss() (or process start), or None."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+def reset_peak_rss():
+    """Start a new peak measurement window (Linux only; elsewhere the lifetime peak is kept)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def release_allocator_caches():
+    """Hand freed memory back to the OS: torch caches and glibc's free lists."""
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def format_bytes(size):
+    return f"{size / 1024 ** 2:.0f} MiB" if size is not None else "unknown"
+
+def fits(needed, budget):
+    """Whether `needed` more bytes fit the budget; always true when RSS is unknown."""
+    rss = current_rss()
+    return rss is None or rss + needed <= budget
+
+class ModelManager:
+    def __init__(self, loaders, costs=None, rss_budget=RSS_BUDGET, verbose=False, prepare=None):
+        self.loaders = loaders
+        # Called once before the first load (e.g. importing torch) so that shared runtime
+        # memory is not counted as the first model's size
+        self.prepare = prepare
+        self.costs = costs or {}
+        self.rss_budget = rss_budget
+        self.verbose = verbose
+        self.resident = OrderedDict()  # model name -> model, least recently used first
+        self.sizes = {}  # measured RSS growth when each model was loaded
+        self.load_seconds = {}
+        self.uses = {}
+
+    def estimated_size(self, model_name):
+        return self.sizes.get(model_name, self.costs.get(model_name, 100) * BYTES_PER_COST)
+
+    def value(self, model_name):
+        """Worth of keeping a model resident: reload time saved per byte, weighted by use."""
+        load_seconds = self.load_seconds.get(model_name, 1.0)
+        return load_seconds * (1 + self.uses.get(model_name, 0)) / max(self.estimated_size(model_name), 1)
+
+    def make_room(self, needed, keep=()):
+        """Release the least valuable resident models until `needed` more bytes fit the budget."""
+        candidates = sorted((name for name in self.resident if name not in keep), key=self.value)
+        for model_name in candidates:
+            if fits(needed, self.rss_budget):
+                break
+            self.release(model_name)
+
+    def get(self, model_name):
+        """Return a loaded model, loading it (and evicting others if needed) on first use."""
+        self.uses[model_name] = self.uses.get(model_name, 0) + 1
+        if model_name in self.resident:
+            self.resident.move_to_end(model_name)
+            return self.resident[model_name]
+
+        if self.prepare is not None:
+            self.prepare()
+            self.prepare = None
+        self.make_room(self.estimated_size(model_name))
+        before = current_rss()
+        start = time.perf_counter()
+        model = self.loaders[model_name]()
+        self.load_seconds[model_name] = time.perf_counter() - start
+        after = current_rss()
+        growth = max(after - before, 0) if before is not None and after is not None else 0
+        self.sizes[model_name] = growth or self.estimated_size(model_name)
+        self.resident[model_name] = model
+        self.log(f"📦 Loaded {model_name} in {self.load_seconds[model_name]:.1f}s (+{format_bytes(self.sizes[model_name])})")
+        return model
+
+    def done(self, model_name):
+        """Called after a model's work; releases it if keeping it would exceed the budget."""
+        if model_name in self.resident and not fits(0, self.rss_budget):
+            self.release(model_name)
+
+    def release(self, model_name):
+        model = self.resident.pop(model_name, None)
+        if model is None:
+            return
+        before = current_rss()
+        del model
+        release_allocator_caches()
+        after = current_rss()
+        freed = max(before - after, 0) if before is not None and after is not None else None
+        self.log(f"🧹 Released {model_name} (-{format_bytes(freed)})")
+
+    def release_all(self):
+        for model_name in list(self.resident):
+            self.release(model_name)
+
+    def preload(self, model_names=None):
+        """Load models (most valuable first) for as long as they fit the budget."""
+        for model_name in sorted(model_names or self.loaders, key=self.value, reverse=True):
+            if not fits(self.estimated_size(model_name), self.rss_budget):
+                self.log(f"⏭ Not preloading {model_name}: over the {format_bytes(self.rss_budget)} budget")
+                continue
+            self.get(model_name)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Log the peak RSS reached while the block runs."""
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.log(f"📈 {name}: peak RSS {format_bytes(peak_rss())} in {time.perf_counter() - start:.1f}s")
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
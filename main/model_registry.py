@@ -0,0 +1,209 @@
+# model_registry.py
+# Local, offline model registry: every semantic model is downloaded once at a pinned revision
+# into MODEL_DIR, converted to safetensors, and recorded with file hashes in the manifest.
+# Loading from the registry never touches the network, and the transformer weights are
+# memory-mapped from the safetensors files, so worker processes share the same pages.
+#
+#   python model_registry.py populate [--revision MODEL_ID=REVISION ...]
+#   python model_registry.py verify
+#   python model_registry.py list
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+
+MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.environ.get("MODEL_REGISTRY_DIR", os.path.join(MAIN_PATH, "models"))
+MANIFEST_FILE = os.environ.get("MODEL_MANIFEST", os.path.join(MAIN_PATH, "model_manifest.json"))
+
+# Weights for other frameworks are never needed
+IGNORE_PATTERNS = ["*.h5", "*.msgpack", "*.ot", "*.onnx", "onnx/*", "openvino/*", "tf_model*", "flax_model*", "rust_model*"]
+
+def read_manifest():
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_manifest(manifest):
+    tmp_path = f"{MANIFEST_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def model_path(model_id):
+    return os.path.join(MODEL_DIR, re.sub(r"[^A-Za-z0-9_.-]", "__", model_id))
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_files(root):
+    hashes = {}
+    for folder, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(folder, name)
+            hashes[os.path.relpath(path, root).replace(os.sep, "/")] = file_sha256(path)
+    return dict(sorted(hashes.items()))
+
+def local_path(model_id):
+    """Registry folder of a model, or None if it has not been populated."""
+    entry = read_manifest().get(model_id)
+    if entry is None:
+        return None
+    path = model_path(model_id)
+    return path if os.path.isdir(path) else None
+
+def pinned_revision(model_id):
+    entry = read_manifest().get(model_id)
+    return entry["revision"] if entry else None
+
+def populate_model(model_id, revision=None):
+    """Download one model at a pinned commit, convert its weights to safetensors and hash it."""
+    from huggingface_hub import HfApi, snapshot_download
+    from sentence_transformers import SentenceTransformer
+
+    # Resolve branch names to a commit so the manifest pins exact weights
+    revision = HfApi().model_info(model_id, revision=revision).sha
+    target = model_path(model_id)
+    snapshot_download(model_id, revision=revision, local_dir=target, ignore_patterns=IGNORE_PATTERNS)
+
+    # Re-save so every module has model.safetensors, then drop the pickled copies
+    model = SentenceTransformer(target, local_files_only=True)
+    model.save(target, safe_serialization=True)
+    for folder, _, files in os.walk(target):
+        for name in files:
+            if name == "pytorch_model.bin":
+                os.remove(os.path.join(folder, name))
+    for cache_dir in (os.path.join(target, ".cache"), os.path.join(target, ".huggingface")):
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+
+    return {"revision": revision, "files": hash_files(target)}
+
+def populate(model_ids, revisions=None):
+    revisions = revisions or {}
+    manifest = read_manifest()
+    for model_id in model_ids:
+        print(f"▶️ Fetching {model_id}...")
+        manifest[model_id] = populate_model(model_id, revisions.get(model_id, manifest.get(model_id, {}).get("revision")))
+        write_manifest(manifest)
+        print(f"✅ {model_id} pinned at {manifest[model_id]['revision']}")
+
+def verify(model_ids=None):
+    """Check registry files against the manifest hashes; returns the ids that do not match."""
+    manifest = read_manifest()
+    broken = []
+    for model_id in model_ids or manifest:
+        entry = manifest.get(model_id)
+        path = model_path(model_id)
+        if entry is None or not os.path.isdir(path) or hash_files(path) != entry["files"]:
+            broken.append(model_id)
+    return broken
+
+SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+def mmap_safetensors(path):
+    """Read a safetensors file as tensors that are views of one private memory map of the file.
+
+    Pages are only read on first touch and stay shared with the page cache (and so with every
+    other process that maps the same file) as long as nothing writes to them.
+    """
+    import struct
+    import torch
+
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    data = torch.empty(0, dtype=torch.uint8).set_(storage)
+    data_start = 8 + header_size
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        begin, end = info["data_offsets"]
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        raw = data[data_start + begin:data_start + end]
+        tensors[name] = raw.view(dtype).view(info["shape"])
+    return tensors
+
+def mmap_transformer_weights(model):
+    """Swap the transformer weights for tensors memory-mapped from the registry's safetensors."""
+    for module in model:
+        auto_model = getattr(module, "auto_model", None)
+        folder = getattr(auto_model, "name_or_path", None)
+        if auto_model is None or not folder:
+            continue
+        weights_file = os.path.join(folder, "model.safetensors")
+        if not os.path.exists(weights_file):
+            continue
+        try:
+            state = mmap_safetensors(weights_file)
+        except (RuntimeError, KeyError, ValueError):
+            continue  # unusual dtype or alignment: keep the regularly loaded copy
+        prefix = getattr(auto_model, "base_model_prefix", "") + "."
+        if prefix != "." and all(name.startswith(prefix) for name in state):
+            state = {name[len(prefix):]: tensor for name, tensor in state.items()}
+        # assign=True makes the mapped tensors the parameters instead of copying into them
+        result = auto_model.load_state_dict(state, strict=False, assign=True)
+        # Tied weights are stored once; anything else missing or left over means the mapped
+        # file does not match the model, which must not pass as a silent no-op
+        tied = set(getattr(auto_model, "_tied_weights_keys", None) or [])
+        missing = [name for name in result.missing_keys if name not in tied]
+        if missing or result.unexpected_keys:
+            raise ValueError(
+                f"{weights_file} does not match {type(auto_model).__name__}: "
+                f"missing {missing[:5]}, unexpected {result.unexpected_keys[:5]}"
+            )
+        if hasattr(auto_model, "tie_weights"):
+            auto_model.tie_weights()
+    return model
+
+def load_registered_model(model_id):
+    """Load a model from the registry without any network access."""
+    path = local_path(model_id)
+    if path is None:
+        raise FileNotFoundError(f"'{model_id}' is not in the model registry; run model_registry.py populate")
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+    from sentence_transformers import SentenceTransformer
+
+    # low_cpu_mem_usage: the model is created on the meta device and filled from the weights
+    # file, instead of being randomly initialised in private memory and then overwritten
+    model = SentenceTransformer(path, local_files_only=True, model_kwargs={"low_cpu_mem_usage": True})
+    return mmap_transformer_weights(model)
+
+if __name__ == "__main__":
+    import comparison
+
+    parser = argparse.ArgumentParser(description="Manage the offline model registry.")
+    parser.add_argument("command", choices=["populate", "verify", "list"])
+    parser.add_argument("--revision", action="append", default=[], metavar="MODEL_ID=REVISION",
+                        help="pin a model to a branch, tag or commit (default: current main)")
+    args = parser.parse_args()
+
+    model_ids = list(comparison.MODEL_IDS.values())
+    if args.command == "populate":
+        populate(model_ids, dict(item.split("=", 1) for item in args.revision))
+    elif args.command == "verify":
+        broken = verify(model_ids)
+        for model_id in model_ids:
+            print(f"{'❌' if model_id in broken else '✅'} {model_id}")
+        if broken:
+            raise SystemExit(1)
+    else:
+        manifest = read_manifest()
+        for model_id in model_ids:
+            entry = manifest.get(model_id)
+            print(f"→ {model_id}: {entry['revision'] if entry else 'not registered'}")
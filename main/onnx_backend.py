@@ -0,0 +1,56 @@
+# onnx_backend.py
+# Optional CPU backend: each semantic model is exported to ONNX once, dynamically quantized
+# to int8 and then served through ONNX Runtime.
+# Needs: pip install "sentence-transformers[onnx]"
+import os
+import platform
+import re
+
+import model_registry
+
+MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
+ONNX_DIR = os.environ.get("ONNX_MODEL_DIR", os.path.join(MAIN_PATH, ".onnx_models"))
+QUANTIZED_SUFFIX = "int8"
+QUANTIZED_FILE = f"onnx/model_{QUANTIZED_SUFFIX}.onnx"
+
+def quantization_config():
+    """Pick the dynamic quantization preset that matches this CPU."""
+    if os.environ.get("ONNX_QUANTIZATION"):
+        return os.environ["ONNX_QUANTIZATION"]
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return "avx2"
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512" in flags:
+        return "avx512"
+    return "avx2"
+
+def export_dir(model_id):
+    return os.path.join(ONNX_DIR, re.sub(r"[^A-Za-z0-9_.-]", "__", model_id))
+
+def export_model(model_id):
+    """Export a model to ONNX and save an int8 quantized copy next to it."""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    target = export_dir(model_id)
+    # Export from the offline registry copy when there is one
+    source = model_registry.local_path(model_id) or model_id
+    # backend="onnx" exports the fp32 graph when the repo does not ship one
+    model = SentenceTransformer(source, backend="onnx")
+    model.save(target)
+    export_dynamic_quantized_onnx_model(model, quantization_config(), target, file_suffix=QUANTIZED_SUFFIX)
+    return target
+
+def load_onnx_model(model_id):
+    """Load the int8 ONNX Runtime version of a model, exporting it on first use."""
+    from sentence_transformers import SentenceTransformer
+
+    target = export_dir(model_id)
+    if not os.path.exists(os.path.join(target, QUANTIZED_FILE)):
+        export_model(model_id)
+    return SentenceTransformer(target, backend="onnx", model_kwargs={"file_name": QUANTIZED_FILE})
@@ -0,0 +1,72 @@
+# onnx_parity.py
+# Scores the Bug Tests corpus with the PyTorch and the int8 ONNX Runtime backend and reports
+# per-model score drift, verdict flips at the match threshold and encoding speedup.
+#
+#   python onnx_parity.py [corpus root] [--report parity.json]
+import argparse
+import json
+import time
+import numpy as np
+
+import comparison
+import corpus_scoring
+from corpus import BUG_TESTS_ROOT, load_corpus, model_texts
+
+def timed_scores(model, model_name, pairs):
+    """Score every pair with an already loaded model; returns (scores, seconds spent encoding)."""
+    texts = model_texts(pairs)
+    model.encode(["warm up"])  # first call pays for graph/session setup
+    start = time.perf_counter()
+    embeddings, spans = corpus_scoring.encode_corpus(model, model_name, texts)
+    seconds = time.perf_counter() - start
+    scores = corpus_scoring.score_pairs(embeddings, spans[:len(pairs)], spans[len(pairs):])
+    return scores, seconds
+
+def compare_backends(pairs, threshold=comparison.MATCH_THRESHOLD):
+    report = {}
+    for model_name, model_id in comparison.MODEL_IDS.items():
+        try:
+            with comparison.suppress_output():
+                torch_model = comparison.load_sentence_transformer(model_id, backend="torch")
+            torch_scores, torch_seconds = timed_scores(torch_model, model_name, pairs)
+            torch_model = None
+            with comparison.suppress_output():
+                onnx_model = comparison.load_sentence_transformer(model_id, backend="onnx")
+            onnx_scores, onnx_seconds = timed_scores(onnx_model, model_name, pairs)
+            onnx_model = None
+        except Exception as e:
+            print(f"⚠️ Error comparing backends for '{model_name}': {e}")
+            report[model_name] = {"error": str(e)}
+            continue
+
+        drift = np.abs(torch_scores - onnx_scores)
+        flips = int(np.sum((torch_scores >= threshold) != (onnx_scores >= threshold)))
+        report[model_name] = {
+            "mean_abs_drift": float(drift.mean()),
+            "max_abs_drift": float(drift.max()),
+            "verdict_flips": flips,
+            "torch_seconds": torch_seconds,
+            "onnx_seconds": onnx_seconds,
+            "speedup": torch_seconds / onnx_seconds if onnx_seconds else None,
+        }
+        speedup = report[model_name]["speedup"]
+        speedup_text = f"{speedup:.1f}x" if speedup is not None else "speedup n/a"
+        print(
+            f"→ [{model_name}]: drift mean {drift.mean():.4f} / max {drift.max():.4f} | "
+            f"{flips} verdict flips | torch {torch_seconds:.2f}s, onnx {onnx_seconds:.2f}s "
+            f"({speedup_text})"
+        )
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare PyTorch and int8 ONNX scores on a bug corpus.")
+    parser.add_argument("root", nargs="?", default=BUG_TESTS_ROOT)
+    parser.add_argument("--report", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    pairs = load_corpus(args.root)
+    print(f"🔍 Comparing backends on {len(pairs)} pairs:\n")
+    report = compare_backends(pairs)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,75 @@
+# parallel_scoring.py
+# Scores one text pair with all semantic models at once: models are split across worker
+# processes and every worker gets a share of the core budget (by model cost) via torch.set_num_threads,
+# so the machine is used fully without oversubscription.
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import comparison
+import model_manager
+from embedding_cache import EmbeddingCache
+
+CORE_BUDGET = int(os.environ.get("SCORING_CORES", os.cpu_count() or 1))
+MIN_THREADS_PER_WORKER = 2
+MIN_PARALLEL_CORES = 4  # below this the serial path is faster than starting workers
+
+def plan_workers(model_names, cores=CORE_BUDGET):
+    """Split models into balanced groups, one per worker; returns (groups, threads for each group)."""
+    workers = min(len(model_names), max(1, cores // MIN_THREADS_PER_WORKER))
+    groups = [[] for _ in range(workers)]
+    loads = [0] * workers
+    # Greedy: most expensive model first, always onto the least loaded worker
+    for model_name in sorted(model_names, key=lambda name: -comparison.MODEL_COSTS.get(name, 1)):
+        i = loads.index(min(loads))
+        groups[i].append(model_name)
+        loads[i] += comparison.MODEL_COSTS.get(model_name, 1)
+
+    # Every worker gets the minimum, the rest of the budget is shared in proportion to load
+    spare = max(0, cores - MIN_THREADS_PER_WORKER * workers)
+    threads = [MIN_THREADS_PER_WORKER + spare * load // sum(loads) for load in loads]
+    return groups, threads
+
+def limit_threads(threads):
+    """Cap this worker's thread pools so workers together stay within the core budget."""
+    # RAYON_NUM_THREADS sizes the Rust tokenizers' pool, which starts on first use
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "RAYON_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+
+def score_group(model_names, threads, rss_budget, log_memory, explanation_text, nlp_summary, pooling):
+    limit_threads(threads)
+    manager = comparison.new_model_manager(rss_budget, verbose=log_memory)
+    return comparison.score_texts(
+        explanation_text, nlp_summary, pooling, manager, cache=EmbeddingCache(), model_names=model_names
+    )
+
+def score_texts_parallel(explanation_text, nlp_summary, pooling=comparison.POOLING, cores=CORE_BUDGET,
+                         rss_budget=model_manager.RSS_BUDGET, log_memory=False):
+    """Same results as comparison.score_texts, computed by one worker process per model group."""
+    model_names = list(comparison.semantic_models)
+    if cores < MIN_PARALLEL_CORES or len(model_names) < 2:
+        manager = comparison.new_model_manager(rss_budget, verbose=log_memory)
+        return comparison.score_texts(explanation_text, nlp_summary, pooling, manager, cache=EmbeddingCache())
+
+    groups, threads = plan_workers(model_names, cores)
+    # spawn, not fork: forked children of a process that already used torch or the
+    # tokenizers thread pool can deadlock
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(groups), mp_context=context) as executor:
+        futures = [
+            # The memory budget is split evenly: each worker holds one model at a time anyway
+            executor.submit(score_group, group, group_threads, rss_budget // len(groups), log_memory,
+                            explanation_text, nlp_summary, pooling)
+            for group, group_threads in zip(groups, threads)
+        ]
+        by_model = {}
+        for group, future in zip(groups, futures):
+            try:
+                for model_name, score, error, seconds in future.result():
+                    by_model[model_name] = (model_name, score, error, seconds)
+            except Exception as e:
+                for model_name in group:
+                    by_model[model_name] = (model_name, None, f"worker failed: {e}", 0.0)
+    return [by_model[model_name] for model_name in model_names]
@@ -0,0 +1,173 @@
+# patch_apply.py
+# Applies an LLM's edit-style response to the buggy source: search/replace blocks
+#
+#   <<<<<<< SEARCH
+#   lines copied from the code
+#   =======
+#   replacement lines
+#   >>>>>>> REPLACE
+#
+# or a unified diff. Hunks are located exactly first, then ignoring indentation and trailing
+# whitespace, then by fuzzy line similarity, so small copy mistakes by the model still apply.
+import difflib
+import re
+
+SEARCH_MARKER = re.compile(r"^<{5,}\s*SEARCH\s*$")
+DIVIDER_MARKER = re.compile(r"^={5,}\s*$")
+REPLACE_MARKER = re.compile(r"^>{5,}\s*REPLACE\s*$")
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+FUZZY_THRESHOLD = 0.85  # minimum similarity of a fuzzy hunk match
+
+class PatchApplyError(Exception):
+    """The response contained no edits, or an edit could not be located in the source."""
+
+def parse_search_replace(text):
+    """[(search lines, replace lines, None)] from search/replace blocks."""
+    edits, search, replace, state = [], [], [], None
+    for line in text.splitlines():
+        if SEARCH_MARKER.match(line):
+            search, replace, state = [], [], "search"
+        elif DIVIDER_MARKER.match(line) and state == "search":
+            state = "replace"
+        elif REPLACE_MARKER.match(line) and state == "replace":
+            edits.append((search, replace, None))
+            state = None
+        elif state == "search":
+            search.append(line)
+        elif state == "replace":
+            replace.append(line)
+    if state is not None:
+        raise PatchApplyError("unterminated search/replace block")
+    return edits
+
+def parse_unified_diff(text):
+    """[(old lines, new lines, old start line)] from the hunks of a unified diff."""
+    edits, hunk = [], None
+    for line in text.splitlines():
+        header = HUNK_HEADER.match(line)
+        if header:
+            hunk = ([], [], int(header.group(1)))
+            edits.append(hunk)
+        elif hunk is None or line.startswith(("--- ", "+++ ", "\\")):
+            continue
+        elif line.startswith("-"):
+            hunk[0].append(line[1:])
+        elif line.startswith("+"):
+            hunk[1].append(line[1:])
+        else:
+            # Context line; models sometimes drop the leading space on blank lines
+            hunk[0].append(line[1:] if line.startswith(" ") else line)
+            hunk[1].append(line[1:] if line.startswith(" ") else line)
+    return edits
+
+def parse_edits(response):
+    """Detect the response format and return its edits."""
+    if any(SEARCH_MARKER.match(line) for line in response.splitlines()):
+        edits = parse_search_replace(response)
+    elif any(HUNK_HEADER.match(line) for line in response.splitlines()):
+        edits = parse_unified_diff(response)
+    else:
+        raise PatchApplyError("response contains neither search/replace blocks nor a unified diff")
+    if not edits:
+        raise PatchApplyError("response contains no complete edits")
+    return edits
+
+def blank_edges(lines):
+    """Number of blank lines at the start and at the end."""
+    lead = next((i for i, line in enumerate(lines) if line.strip()), len(lines))
+    trail = next((i for i, line in enumerate(reversed(lines)) if line.strip()), len(lines))
+    return lead, trail
+
+def trim_blank_edges(old_lines, new_lines):
+    """Drop blank edge lines from the search text, and as many matching ones from the replacement."""
+    lead, trail = blank_edges(old_lines)
+    if lead == len(old_lines):
+        return [], new_lines
+    new_lead, new_trail = blank_edges(new_lines)
+    lead_cut, trail_cut = min(lead, new_lead), min(trail, new_trail)
+    return old_lines[lead:len(old_lines) - trail], new_lines[lead_cut:len(new_lines) - trail_cut]
+
+def candidates(source_lines, old_lines, matches):
+    """Start indices where old_lines matches source_lines under the matches(a, b) line test."""
+    size = len(old_lines)
+    return [
+        i for i in range(len(source_lines) - size + 1)
+        if all(matches(source_lines[i + j], old_lines[j]) for j in range(size))
+    ]
+
+def fuzzy_candidates(source_lines, old_lines):
+    """Best-scoring windows at least FUZZY_THRESHOLD similar to old_lines."""
+    size = len(old_lines)
+    target = "\n".join(line.strip() for line in old_lines)
+    best, best_score = [], FUZZY_THRESHOLD
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(target)
+    for i in range(len(source_lines) - size + 1):
+        matcher.set_seq1("\n".join(line.strip() for line in source_lines[i:i + size]))
+        if matcher.real_quick_ratio() < best_score or matcher.quick_ratio() < best_score:
+            continue
+        score = matcher.ratio()
+        if score > best_score:
+            best, best_score = [i], score
+        elif score == best_score:
+            best.append(i)
+    return best
+
+def locate(source_lines, old_lines, hint=None):
+    """Index of old_lines in source_lines and whether indentation may differ; raises PatchApplyError."""
+    tests = [
+        (lambda a, b: a == b, False),
+        (lambda a, b: a.rstrip() == b.rstrip(), False),
+        (lambda a, b: a.strip() == b.strip(), True),
+    ]
+    for matches, reindent in tests:
+        found = candidates(source_lines, old_lines, matches)
+        if found:
+            break
+    else:
+        found, reindent = fuzzy_candidates(source_lines, old_lines), True
+    if not found:
+        preview = "\n".join(old_lines[:3])
+        raise PatchApplyError(f"could not find the lines to replace:\n{preview}")
+    if len(found) > 1:
+        if hint is None:
+            raise PatchApplyError(f"the lines to replace occur {len(found)} times; add more context")
+        return min(found, key=lambda i: abs(i + 1 - hint)), reindent
+    return found[0], reindent
+
+def indentation(line):
+    return line[:len(line) - len(line.lstrip())]
+
+def shift_indent(new_lines, model_indent, source_indent):
+    """Re-base replacement lines from the model's indentation onto the source's."""
+    shifted = []
+    for line in new_lines:
+        if line.startswith(model_indent):
+            shifted.append(source_indent + line[len(model_indent):] if line.strip() else line)
+        else:
+            shifted.append(line)
+    return shifted
+
+def apply_edits(source, edits):
+    """Apply [(old lines, new lines, line hint)] to source, top to bottom; returns the new source."""
+    lines = source.splitlines()
+    offset = 0  # line shift from edits already applied above
+    for number, (old_lines, new_lines, hint) in enumerate(edits, start=1):
+        old_lines, new_lines = trim_blank_edges(old_lines, new_lines)
+        if not old_lines:
+            raise PatchApplyError(f"edit {number} has nothing to search for")
+        try:
+            start, reindent = locate(lines, old_lines, hint + offset if hint else None)
+        except PatchApplyError as e:
+            raise PatchApplyError(f"edit {number}: {e}")
+        if reindent:
+            first = next(line for line in old_lines if line.strip())
+            source_first = next(line for line in lines[start:start + len(old_lines)] if line.strip())
+            new_lines = shift_indent(new_lines, indentation(first), indentation(source_first))
+        lines[start:start + len(old_lines)] = new_lines
+        offset += len(new_lines) - len(old_lines)
+    return "\n".join(lines) + ("\n" if source.endswith("\n") else "")
+
+def apply_response(source, response):
+    """Fixed source from an edit-style model response; raises PatchApplyError on failure."""
+    return apply_edits(source, parse_edits(response))
@@ -1,11 +1,49 @@
-import openai
+import os
 import re
+import time
 
-def fix_and_explain_code(buggy_code):
-    prompt = f"""
+import llm_accounting
+import llm_backends
+import llm_cache
+
+MODEL = llm_backends.MODEL
+PROMPT_VERSION = 1  # bump whenever build_prompt changes, so cached responses are not reused
+PARAMS = {"temperature": 0}
+# Several candidates only differ when sampled; used by generate_candidates instead of PARAMS
+CANDIDATE_PARAMS = {"temperature": float(os.environ.get("LLM_CANDIDATE_TEMPERATURE", 0.7))}
+# "edits": the model returns search/replace blocks (patch_apply.py), so output tokens scale
+# with the size of the fix; "full": the model returns the whole fixed file
+RESPONSE_MODE = os.environ.get("LLM_RESPONSE_MODE", "edits")
+RESPONSE_MODES = ("edits", "full")
+DELIMITER = "---EXPLANATION---"
+NO_BUGS = "NO BUGS FOUND"
+# Models vary the reply: "No bugs found.", "**NO BUGS FOUND**", "No bug was found", ...
+NO_BUGS_PATTERN = re.compile(r"[\W_]*no bugs? (?:were |was )?found\b", re.IGNORECASE)
+REPAIR_VERSION = "repair-1"  # cache key part for repair prompts
+EXCERPT_NOTE = """
+    The code is an excerpt of a larger file: functions and classes whose body is only '...' are
+    unchanged and omitted.{}
+"""
+EXCERPT_FULL_NOTE = " Return the excerpt with the fix applied, keeping those placeholders."
+
+EDITS_INSTRUCTION = """1. Provide only the changes, as search/replace blocks without extra explanation:
+    <<<<<<< SEARCH
+    lines copied exactly from the code (enough of them to be unique)
+    =======
+    the replacement lines
+    >>>>>>> REPLACE"""
+FULL_INSTRUCTION = "1. Provide only the fixed code without extra explanation."
+
+def prompt_version(excerpt=False, mode="full"):
+    """Cache key part for the prompt template (every excerpt/mode variant gets its own)."""
+    version = f"{PROMPT_VERSION}+excerpt" if excerpt else str(PROMPT_VERSION)
+    return version if mode == "full" else f"{version}+{mode}"
+
+def build_prompt(buggy_code, excerpt=False, mode="full"):
+    return f"""
     You are a senior software engineer.
-    The following code has a bug.
-    1. Provide only the fixed code without extra explanation.
+    The following code has a bug.{EXCERPT_NOTE.format(EXCERPT_FULL_NOTE if mode == "full" else "") if excerpt else ""}
+    {EDITS_INSTRUCTION if mode == "edits" else FULL_INSTRUCTION}
     2. Provide a detailed explanation of what was changed (after the fixed code, separated by a delimiter '---EXPLANATION---').
     3. If no bugs were found, the explanaton should be "NO BUGS FOUND".
 
@@ -13,13 +51,178 @@ def fix_and_explain_code(buggy_code):
     {buggy_code}
     """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
+class StreamSplitter:
+    """Collects a streamed completion and calls on_code(code part) as soon as the code is complete.
+
+    The code part ends at the explanation delimiter or, in full-file mode, at the fence that
+    closes a leading ``` block, whichever arrives first; on_code is called at most once.
+    """
+
+    def __init__(self, on_code, fence=True):
+        self.on_code = on_code
+        self.fence = fence
+        self.text = ""
+        self.scanned = 0  # everything before this offset has been searched already
+        self.done = False
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self.done or not chunk:
+            return
+        start = max(0, self.scanned - len(DELIMITER))
+        end = self.text.find(DELIMITER, start)
+        if end < 0 and self.fence:
+            end = self.closing_fence(start)
+        self.scanned = len(self.text)
+        if end >= 0:
+            self.done = True
+            self.on_code(self.text[:end])
+
+    def closing_fence(self, start):
+        """Offset just after the ``` line closing a leading code block, or -1."""
+        stripped = self.text.lstrip()
+        if not stripped.startswith("```"):
+            return -1
+        opening = self.text.find("\n", len(self.text) - len(stripped))
+        if opening < 0:
+            return -1
+        # Only complete lines can be a closing fence; resume from the line containing start
+        offset = max(opening + 1, self.text.rfind("\n", 0, start) + 1)
+        while True:
+            newline = self.text.find("\n", offset)
+            if newline < 0:
+                return -1
+            if self.text[offset:newline].strip() == "```":
+                return newline
+            offset = newline + 1
+
+def is_no_bugs(text, prefix=False):
+    """Whether text is the "no bugs found" reply (or, with prefix, starts with it)."""
+    text = text.strip()
+    match = NO_BUGS_PATTERN.match(text)
+    return match is not None and (prefix or not re.sub(r"[\W_]", "", text[match.end():]))
+
+def split_response(result):
+    """(code part or None for "no bugs", explanation) of a completion."""
+    if is_no_bugs(result):
+        return None, NO_BUGS
+    if DELIMITER not in result:
+        return result, ""
+    code, explanation = result.split(DELIMITER, 1)
+    if is_no_bugs(clean_code_block(code)) or is_no_bugs(explanation, prefix=True):
+        return None, NO_BUGS
+    return code, explanation.strip()
+
+def cache_backend(backend):
+    """The cache key's backend part: None for real API responses, else the backend's name."""
+    return None if backend.billable else backend.name
+
+def fix_and_explain_code(buggy_code, cache=None, excerpt=False, mode="full", on_code=None, backend=None,
+                         bug_id=None, accounting=None):
+    """Completion for buggy_code; with on_code the reply is streamed and on_code gets the code early.
+
+    backend defaults to the one selected by LLM_BACKEND (see llm_backends.py); cache=False
+    skips the response cache and accounting=False skips usage recording (llm_accounting.py).
+    """
+    splitter = StreamSplitter(on_code, fence=mode == "full") if on_code is not None else None
+    backend = backend or llm_backends.get_backend()
+    if cache is None:
+        cache = llm_cache.open_cache()
+    if accounting is None:
+        accounting = llm_accounting.open_store()
+    prompt = build_prompt(buggy_code, excerpt, mode)
+    start = time.perf_counter()
+
+    def account(response, usage, ttft=None, cached=False, error=None):
+        if accounting:
+            accounting.record(llm_accounting.call_record(
+                bug_id, backend.model, mode, prompt, response, usage, ttft,
+                time.perf_counter() - start, cached, error, backend.name,
+            ))
+
+    if cache:
+        cached = cache.get(backend.model, prompt_version(excerpt, mode), buggy_code, PARAMS, cache_backend(backend))
+        if cached is not None:
+            if splitter is not None:
+                splitter.feed(cached)
+            account(cached, {}, cached=True)
+            return cached
+
+    usage, first_token = {}, []
+
+    def on_text(text):
+        if not first_token:
+            first_token.append(time.perf_counter() - start)
+        splitter.feed(text)
+
+    try:
+        content = backend.complete(prompt, PARAMS, on_text=on_text if splitter is not None else None, usage=usage)
+    except Exception as e:
+        account(None, usage, error=f"{type(e).__name__}: {e}")
+        raise
+    account(content, usage, first_token[0] if first_token else None)
+
+    if cache:
+        cache.put(backend.model, prompt_version(excerpt, mode), buggy_code, PARAMS, content, cache_backend(backend))
+    return content
+
+def build_repair_prompt(context, message):
+    return f"""
+    You are a senior software engineer.
+    A fix you proposed does not compile: {message}.
+    These are the lines around the error:
 
-    return response.choices[0].message["content"]
+    {context}
+
+    {EDITS_INSTRUCTION.replace("the code", "these lines")}
+    Change only what is needed to correct the error.
+    """
+
+def repair_code(context, message, backend=None, cache=None, bug_id=None, accounting=None):
+    """Search/replace edits fixing a syntax error, from a prompt holding only the error's context."""
+    backend = backend or llm_backends.get_backend()
+    if cache is None:
+        cache = llm_cache.open_cache()
+    if accounting is None:
+        accounting = llm_accounting.open_store()
+    prompt = build_repair_prompt(context, message)
+    cached = cache.get(backend.model, REPAIR_VERSION, prompt, PARAMS, cache_backend(backend)) if cache else None
+    start, usage = time.perf_counter(), {}
+    content = cached if cached is not None else backend.complete(prompt, PARAMS, usage=usage)
+    if accounting:
+        accounting.record(llm_accounting.call_record(
+            bug_id, backend.model, "repair", prompt, content, usage, None, time.perf_counter() - start,
+            cached is not None, backend=backend.name,
+        ))
+    if cache and cached is None:
+        cache.put(backend.model, REPAIR_VERSION, prompt, PARAMS, content, cache_backend(backend))
+    return content
+
+def generate_candidates(buggy_code, k, excerpt=False, mode="full", backend=None, bug_id=None, accounting=None):
+    """k completions for buggy_code from one request (n=k); see candidates.py for ranking them.
+
+    Sampled candidates are never cached; the call is recorded like fix_and_explain_code's.
+    """
+    backend = backend or llm_backends.get_backend()
+    if accounting is None:
+        accounting = llm_accounting.open_store()
+    prompt = build_prompt(buggy_code, excerpt, mode)
+    start, usage = time.perf_counter(), {}
+    try:
+        responses = backend.candidates(prompt, CANDIDATE_PARAMS, k, usage=usage)
+    except Exception as e:
+        if accounting:
+            accounting.record(llm_accounting.call_record(
+                bug_id, backend.model, mode, prompt, None, usage, None, time.perf_counter() - start,
+                error=f"{type(e).__name__}: {e}", backend=backend.name,
+            ))
+        raise
+    if accounting:
+        accounting.record(llm_accounting.call_record(
+            bug_id, backend.model, mode, prompt, "".join(responses), usage, None, time.perf_counter() - start,
+            backend=backend.name,
+        ))
+    return responses
 
 def clean_code_block(text):
     # Remove triple backticks and language tags
@@ -27,4 +230,17 @@ def clean_code_block(text):
     text = re.sub(r"```$", "", text, flags=re.MULTILINE).strip()
     # Remove any leading 'Fixed Code:' label
     text = re.sub(r"^Fixed Code:\s*", "", text, flags=re.IGNORECASE).strip()
-    return text
\ No newline at end of file
+    return text
+
+def fixed_code_from(buggy_code, code_part, excerpt, mode):
+    """Full fixed file from the code part of a response; raises PatchApplyError or SliceError."""
+    import context_slicer
+    import patch_apply
+    if mode == "edits":
+        # Search/replace blocks apply to the full file directly, excerpt or not
+        return patch_apply.apply_response(buggy_code, code_part)
+    fixed_code = clean_code_block(code_part)
+    if excerpt and fixed_code:
+        # The model fixed an excerpt; put its definitions back into the full file
+        fixed_code = context_slicer.splice(buggy_code, fixed_code)
+    return fixed_code
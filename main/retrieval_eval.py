@@ -0,0 +1,88 @@
+# retrieval_eval.py
+# Retrieval view of the scores: every explanation is compared with every NLP summary of the
+# corpus (per model, one normalized matmul computed in row tiles), and we report where the
+# bug's own summary ranks. A match score only means something if the right pair outranks
+# the other bugs' pairs.
+#
+#   python retrieval_eval.py [corpus root] [--k 1 5 10] [--tile 1024]
+import argparse
+import numpy as np
+
+import comparison
+import corpus_scoring
+from corpus import BUG_TESTS_ROOT, load_corpus, model_texts
+from embedding_cache import EmbeddingCache
+
+TILE_ROWS = 1024  # similarity rows held in memory at once (TILE_ROWS x corpus size floats)
+RECALL_AT = (1, 5, 10)
+
+def text_vectors(embeddings, spans):
+    """One unit vector per text: the token-weighted mean of its chunk embeddings."""
+    vectors = np.empty((len(spans), embeddings.shape[1]), dtype=np.float32)
+    for i, (start, lengths) in enumerate(spans):
+        chunks = embeddings[start:start + len(lengths)]
+        vectors[i] = np.average(chunks, axis=0, weights=lengths)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors
+
+def correct_pair_ranks(queries, documents, tile_rows=TILE_ROWS):
+    """Rank (1 = best) of documents[i] among all documents for queries[i], tile by tile."""
+    ranks = np.empty(len(queries), dtype=np.int64)
+    for start in range(0, len(queries), tile_rows):
+        tile = queries[start:start + tile_rows] @ documents.T
+        rows = np.arange(tile.shape[0])
+        correct = tile[rows, rows + start]
+        # Ties count in favour of the correct pair
+        ranks[start:start + tile.shape[0]] = 1 + np.sum(tile > correct[:, None], axis=1)
+    return ranks
+
+def retrieval_metrics(ranks, recall_at=RECALL_AT):
+    metrics = {
+        "mrr": float(np.mean(1.0 / ranks)),
+        "median_rank": float(np.median(ranks)),
+    }
+    for k in recall_at:
+        metrics[f"recall@{k}"] = float(np.mean(ranks <= k))
+    return metrics
+
+def evaluate_corpus(pairs, recall_at=RECALL_AT, tile_rows=TILE_ROWS, cache=None):
+    """Retrieval metrics per model, in both directions (explanation -> summary and back)."""
+    texts = model_texts(pairs)
+    report = {}
+    for model_name, load_model in comparison.semantic_models.items():
+        try:
+            with comparison.suppress_output():
+                model = load_model()
+            embeddings, spans = corpus_scoring.encode_corpus(model, model_name, texts, cache)
+        except Exception as e:
+            print(f"⚠️ Error using model '{model_name}': {e}")
+            report[model_name] = {"error": str(e)}
+            continue
+        model = None
+
+        vectors = text_vectors(embeddings, spans)
+        explanations, summaries = vectors[:len(pairs)], vectors[len(pairs):]
+        report[model_name] = {
+            "explanation_to_summary": retrieval_metrics(correct_pair_ranks(explanations, summaries, tile_rows), recall_at),
+            "summary_to_explanation": retrieval_metrics(correct_pair_ranks(summaries, explanations, tile_rows), recall_at),
+        }
+    if cache is not None:
+        cache.flush()
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrieval metrics of explanation/summary pairs over a bug corpus.")
+    parser.add_argument("root", nargs="?", default=BUG_TESTS_ROOT)
+    parser.add_argument("--k", type=int, nargs="+", default=list(RECALL_AT))
+    parser.add_argument("--tile", type=int, default=TILE_ROWS)
+    args = parser.parse_args()
+
+    pairs = load_corpus(args.root)
+    print(f"🔍 Retrieval over {len(pairs)} bugs:\n")
+    report = evaluate_corpus(pairs, args.k, args.tile, cache=EmbeddingCache())
+    for model_name, directions in report.items():
+        if "error" in directions:
+            continue
+        for direction, metrics in directions.items():
+            recalls = " ".join(f"R@{k} {metrics[f'recall@{k}']:.2f}" for k in args.k)
+            print(f"→ [{model_name}] {direction}: MRR {metrics['mrr']:.3f} | median rank {metrics['median_rank']:.0f} | {recalls}")
@@ -1,21 +1,27 @@
 # run_all.py
+import argparse
+import json
 import os
 import subprocess
-import sys
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
 EXTERNAL_PATH = os.path.abspath(os.path.join(MAIN_PATH, "..", "external"))
 ALL_BUGS_ROOT = os.path.join(MAIN_PATH, "all_bugs")
 BUGSINPY_ROOT = os.path.join(EXTERNAL_PATH, "bugsinpy", "projects")
+# Runs code analysis while the LLM is still streaming the explanation
+ANALYSIS_POOL = ThreadPoolExecutor(max_workers=1)
 
-def run_script(script_name):
-    """Runs a Python script using subprocess."""
+def run_script(script_name, *args):
+    """Runs a Python script using subprocess; returns whether it succeeded."""
     script_path = os.path.join(MAIN_PATH, script_name)
     try:
-        subprocess.run(["python", script_path], check=True)
-    except subprocess.CalledProcessError:
-        sys.exit(1)  # Stop further execution if a script fails
+        subprocess.run(["python", script_path, *args], check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"❌ {script_name} failed with exit code {e.returncode}")
+        return False
+    return True
 
 def get_modified_file_from_patch(patch_file):
     with open(patch_file, "r", encoding="utf-8") as f:
@@ -29,23 +35,123 @@ def get_modified_file_from_patch(patch_file):
                     break
         return match
 
-def copy_and_patch_buggy_file(buggy_file_path):
+def prompt_source(buggy_file_path, patch_file, modified_file_rel, use_slicing=True):
+    """Code to send to the LLM: an AST excerpt around the bug's hunks for large files.
+
+    Returns (source, is_excerpt).
+    """
+    import context_slicer
+    with open(buggy_file_path, "r", encoding="utf-8") as f:
+        buggy_code = f.read()
+    if not use_slicing:
+        return buggy_code, False
+    with open(patch_file, "r", encoding="utf-8") as f:
+        return context_slicer.excerpt_for_bug(buggy_code, f.read(), modified_file_rel)
+
+def write_main_file(file_name, text):
+    with open(os.path.join(MAIN_PATH, file_name), "w", encoding="utf-8") as f:
+        f.write(text)
+
+def run_analysis():
+    """analyser.py and json_to_nlp.py; they only need code1.py and code2.py."""
+    for script_name in ("analyser.py", "json_to_nlp.py"):
+        subprocess.run(["python", os.path.join(MAIN_PATH, script_name)], check=True, cwd=MAIN_PATH)
+
+def copy_and_patch_buggy_file(buggy_file_path, source=None, excerpt=False, result=None, mode="full", stream=False,
+                              bug_id=None):
+    """Write code1.py, code2.py and explanation.txt for a bug.
+
+    With stream=True the completion is streamed and run_analysis starts as soon as the fixed
+    code is complete, while the explanation is still being generated. Returns that analysis
+    future, or None if the analysis still has to be run. bug_id labels the call's token and
+    latency record (llm_accounting.py).
+
+    The fixed code goes through validation.py first; raises ValidationError when the model
+    found no bugs or its fix could not be repaired.
+    """
+    import context_slicer
+    import patch_apply
+    import patchmaker
+    import validation
     # Copy buggy file to main/code1.py
     shutil.copyfile(buggy_file_path, os.path.join(MAIN_PATH, "code1.py"))
-    # Generate patched file using patchmaker.py
+    with open(buggy_file_path, "r", encoding="utf-8") as f:
+        buggy_code = f.read()
+
+    analysis = None
+
+    def on_code(code_part):
+        nonlocal analysis
+        try:
+            fixed_code = patchmaker.fixed_code_from(buggy_code, code_part, excerpt, mode)
+        except (patch_apply.PatchApplyError, context_slicer.SliceError):
+            return  # reported and retried below once the whole response is in
+        if validation.structure_error(buggy_code, fixed_code) is not None:
+            return  # repaired below once the whole response is in
+        write_main_file("code2.py", fixed_code)
+        analysis = ANALYSIS_POOL.submit(run_analysis)
+
+    # Generate patched file using patchmaker.py (unless it was generated up front)
+    if result is None:
+        result = patchmaker.fix_and_explain_code(
+            source or buggy_code, excerpt=excerpt, mode=mode, on_code=on_code if stream else None, bug_id=bug_id
+        )
+    code_part, explanation = patchmaker.split_response(result)
+    write_main_file("explanation.txt", explanation)
+    if code_part is None:
+        # "No bugs" may only show after the delimiter, when the analysis has already started
+        if analysis is not None and not analysis.cancel():
+            analysis.exception()  # wait for it; the next bug reuses code2.py
+        raise validation.ValidationError("the model found no bugs")
+    if analysis is not None:
+        return analysis
+
+    try:
+        fixed_code = patchmaker.fixed_code_from(buggy_code, code_part, excerpt, mode)
+    except patch_apply.PatchApplyError as e:
+        print(f"⚠️ Could not apply the model's edits ({e}); retrying in full-file mode")
+        return copy_and_patch_buggy_file(buggy_file_path, source, excerpt, mode="full", stream=stream,
+                                         bug_id=bug_id)
+    except context_slicer.SliceError as e:
+        print(f"⚠️ Could not splice the fixed excerpt ({e}); retrying with the whole file")
+        return copy_and_patch_buggy_file(buggy_file_path, stream=stream, bug_id=bug_id)
+    fixed_code = validation.validate_and_repair(
+        buggy_code, fixed_code, repair=lambda context, message: patchmaker.repair_code(context, message, bug_id=bug_id)
+    )
+    write_main_file("code2.py", fixed_code)
+    return None
+
+def process_candidates(buggy_file_path, source, excerpt, mode, k, top, bug_id):
+    """Generate k candidates in one request, rank them, and score the best `top` ones.
+
+    Returns the number of candidates passed on to comparison.py (0 when none was valid).
+    """
+    import candidates
     import patchmaker
     with open(buggy_file_path, "r", encoding="utf-8") as f:
         buggy_code = f.read()
-    result = patchmaker.fix_and_explain_code(buggy_code)
-    if result == "NO BUGS FOUND":
-        fixed_code = ""
-    else:
-        fixed_code, _ = result.split("---EXPLANATION---", 1)
-        fixed_code = patchmaker.clean_code_block(fixed_code)
-    with open(os.path.join(MAIN_PATH, "code2.py"), "w", encoding="utf-8") as f:
-        f.write(fixed_code)
+    responses = patchmaker.generate_candidates(source, k, excerpt, mode, bug_id=bug_id)
+    ranked = candidates.rank_candidates(buggy_code, responses, excerpt, mode)
+    candidates.print_ranking(ranked)
 
-if __name__ == "__main__":
+    chosen = []
+    for candidate in ranked:
+        # Identical fixes would only be scored twice
+        if candidate["features"]["valid"] and all(c["fixed_code"] != candidate["fixed_code"] for c in chosen):
+            chosen.append(candidate)
+    chosen = chosen[:top]
+    for rank, candidate in enumerate(chosen):
+        # The analysis was done while ranking; write what analyser.py / json_to_nlp.py would have
+        shutil.copyfile(buggy_file_path, os.path.join(MAIN_PATH, "code1.py"))
+        write_main_file("code2.py", candidate["fixed_code"])
+        write_main_file("explanation.txt", candidate["explanation"])
+        write_main_file("changes.json", json.dumps(candidate["changes"], indent=2))
+        write_main_file("nlp_output.txt", candidate["summary"])
+        run_script("comparison.py", "--bug-id", bug_id if rank == 0 else f"{bug_id}#{rank + 1}")
+    return len(chosen)
+
+def find_bugs():
+    """Yield (project, bug number, buggy file path, patch file, modified file) for every bug in all_bugs."""
     # Loop through all projects in all_bugs
     for project_name in os.listdir(ALL_BUGS_ROOT):
         project_path = os.path.join(ALL_BUGS_ROOT, project_name)
@@ -56,7 +162,6 @@ if __name__ == "__main__":
             bug_path = os.path.join(project_path, bug_number)
             if not os.path.isdir(bug_path):
                 continue
-            print(f"Processing project: {project_name}, bug: {bug_number}")
 
             # Find corresponding bugsinpy folder
             bugsinpy_proj_path = os.path.join(BUGSINPY_ROOT, project_name, "bugs", bug_number)
@@ -70,21 +175,120 @@ if __name__ == "__main__":
                 print("Could not determine modified file from patch.")
                 continue
 
-            modified_file_rel = modified_file_rel.replace("/", os.sep).replace("\\", os.sep)
+            local_file_rel = modified_file_rel.replace("/", os.sep).replace("\\", os.sep)
 
             # Locate buggy file in all_bugs/project/bug/buggy
-            buggy_file_path = os.path.join(bug_path, "buggy", project_name, modified_file_rel)
+            buggy_file_path = os.path.join(bug_path, "buggy", project_name, local_file_rel)
             if not os.path.exists(buggy_file_path):
                 print(f"Buggy file not found: {buggy_file_path}")
                 continue
 
-            # Copy buggy file and generate patch
-            copy_and_patch_buggy_file(buggy_file_path)
+            yield project_name, bug_number, buggy_file_path, patch_file, modified_file_rel
+
+def generate_all_patches(sources, concurrency, mode, bug_ids=None):
+    """Ask the LLM for every fix at once (llm_pool.py) instead of one blocking call per bug."""
+    import llm_pool
+    codes = {path: source for path, (source, _) in sources.items()}
+    excerpts = {path for path, (_, excerpt) in sources.items() if excerpt}
+    print(f"🤖 Generating {len(codes)} patches with up to {concurrency} requests in flight")
+    return llm_pool.run_patches(codes, concurrency=concurrency, excerpts=excerpts, mode=mode, bug_ids=bug_ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate, analyse and score a fix for every bug.")
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="generate all patches up front with this many concurrent LLM requests (0 = one at a time)")
+    parser.add_argument("--batch", action="store_true",
+                        help="generate all patches through the batch endpoint (batch_jobs.py): slower, half the price")
+    parser.add_argument("--candidates", type=int, default=None,
+                        help="ask for this many candidate fixes per bug in one request and rank them (default: LLM_CANDIDATES or 1)")
+    parser.add_argument("--top", type=int, default=1,
+                        help="with --candidates, score this many of the best candidates with the embedding models")
+    parser.add_argument("--no-slicing", action="store_true",
+                        help="always send the whole buggy file instead of an excerpt around the hunks")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="wait for the whole completion instead of starting analysis when the code is complete")
+    parser.add_argument("--response-mode", choices=["edits", "full"], default=None,
+                        help="ask for search/replace edits or the whole fixed file (default: LLM_RESPONSE_MODE or edits)")
+    args = parser.parse_args()
+    import candidates
+    k = args.candidates or candidates.CANDIDATES
+    if k > 1 and (args.batch or args.concurrency > 0):
+        parser.error("--candidates cannot be combined with --batch or --concurrency")
+    import llm_accounting
+    import llm_backends
+    import llm_cache
+    import patchmaker
+    import validation
+    mode = args.response_mode or patchmaker.RESPONSE_MODE
+    # comparison.py runs as a subprocess; give its score rows the same run id as the usage rows
+    os.environ["SCORE_RUN_ID"] = llm_accounting.RUN_ID
+    if (args.concurrency > 0 or args.batch) and llm_backends.BACKEND != "http":
+        # llm_pool.py and batch_jobs.py talk HTTP themselves; fake/record/replay only go through patchmaker
+        print(f"⚠️ --concurrency and --batch need LLM_BACKEND=http, generating one at a time with '{llm_backends.BACKEND}'")
+        args.concurrency, args.batch = 0, False
+
+    bugs = list(find_bugs())
+    sources = {
+        buggy_file_path: prompt_source(buggy_file_path, patch_file, modified_file_rel, not args.no_slicing)
+        for _, _, buggy_file_path, patch_file, modified_file_rel in bugs
+    }
+    bug_ids = {buggy_file_path: f"{project_name}/{bug_number}" for project_name, bug_number, buggy_file_path, _, _ in bugs}
+    if args.batch:
+        import batch_jobs
+        responses = batch_jobs.run_batch(sources, mode, bug_ids)
+    elif args.concurrency > 0:
+        responses = generate_all_patches(sources, args.concurrency, mode, bug_ids)
+    else:
+        responses = {}
 
-            # Change cwd to main before running analysis scripts
-            os.chdir(MAIN_PATH)
+    for project_name, bug_number, buggy_file_path, _, _ in bugs:
+        print(f"Processing project: {project_name}, bug: {bug_number}")
+        if k > 1:
+            source, excerpt = sources[buggy_file_path]
+            try:
+                chosen = process_candidates(buggy_file_path, source, excerpt, mode, k, args.top, bug_ids[buggy_file_path])
+            except (llm_backends.BackendError, llm_cache.CacheMiss) as e:
+                print(f"⚠️ Patch generation failed, skipping: {e}")
+                continue
+            if not chosen:
+                print(f"⚠️ None of the {k} candidates was a valid fix, skipping")
+            continue
+
+        result = responses.get(buggy_file_path)
+        if isinstance(result, Exception):
+            print(f"⚠️ Patch generation failed, skipping: {result}")
+            continue
+
+        # Copy buggy file and generate patch
+        source, excerpt = sources[buggy_file_path]
+        try:
+            analysis = copy_and_patch_buggy_file(
+                buggy_file_path, source, excerpt, result, mode, stream=not args.no_stream,
+                bug_id=bug_ids[buggy_file_path],
+            )
+        except (llm_backends.BackendError, llm_cache.CacheMiss) as e:
+            # Same as a failed request in --concurrency mode: skip this bug, keep the sweep going
+            print(f"⚠️ Patch generation failed, skipping: {e}")
+            continue
+        except validation.ValidationError as e:
+            print(f"⚠️ No usable fix ({e}), skipping")
+            continue
+
+        # Change cwd to main before running analysis scripts
+        os.chdir(MAIN_PATH)
+
+        # Run analyser.py, json_to_nlp.py (unless already started while streaming), comparison.py
+        # A failing script skips this bug instead of stopping the sweep
+        if analysis is not None:
+            try:
+                analysis.result()
+            except subprocess.CalledProcessError as e:
+                print(f"❌ Analysis failed with exit code {e.returncode}, skipping")
+                continue
+        elif not (run_script("analyser.py") and run_script("json_to_nlp.py")):
+            continue
+        run_script("comparison.py", "--bug-id", f"{project_name}/{bug_number}")
 
-            # Run analyser.py, json_to_nlp.py, comparison.py
-            run_script("analyser.py")
-            run_script("json_to_nlp.py")
-            run_script("comparison.py")
\ No newline at end of file
+    usage_store = llm_accounting.open_store()
+    if usage_store:
+        llm_accounting.print_summary(llm_accounting.summarize(usage_store.rows(llm_accounting.RUN_ID)), "LLM usage this run")
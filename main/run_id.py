@@ -0,0 +1,8 @@
+# run_id.py
+# Id shared by every record one pipeline run writes: LLM usage rows (llm_accounting.py) and
+# score rows (score_store.py). run_all.py exports it as SCORE_RUN_ID so that its subprocesses
+# use the same one. Kept free of dependencies so that importing it costs nothing.
+import os
+import uuid
+
+RUN_ID = os.environ.get("SCORE_RUN_ID") or uuid.uuid4().hex[:12]
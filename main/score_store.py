@@ -0,0 +1,155 @@
+# score_store.py
+# Append-only columnar store for comparison results. Every append writes one new Parquet
+# part under STORE_DIR (so concurrent runs never rewrite each other's files); queries read
+# the directory as one pyarrow dataset. `compact` merges small parts when there are many.
+#
+#   python score_store.py report     # per-model match rate over everything stored
+#   python score_store.py compact
+import argparse
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+from embedding_cache import normalize_text
+from run_id import RUN_ID
+
+MAIN_PATH = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.environ.get("SCORE_STORE_DIR", os.path.join(MAIN_PATH, "scores"))
+LEXICAL_REVISION = "lexical-v1"
+
+def schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("run_id", pa.string()),
+        ("bug_id", pa.string()),
+        ("stage", pa.string()),
+        ("model", pa.string()),
+        ("model_revision", pa.string()),
+        ("backend", pa.string()),
+        ("pooling", pa.string()),
+        ("score", pa.float64()),
+        ("precision", pa.float64()),  # alignment pooling only; score is then the F1
+        ("recall", pa.float64()),
+        ("threshold", pa.float64()),
+        ("verdict", pa.bool_()),
+        ("error", pa.string()),
+        ("model_seconds", pa.float64()),
+        ("total_seconds", pa.float64()),
+        ("explanation_hash", pa.string()),
+        ("summary_hash", pa.string()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+    ])
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text.lower()).encode("utf-8")).hexdigest()
+
+def comparison_records(bug_id, stage, results, explanation_text, nlp_summary, pooling, band, threshold,
+                       backend, revisions, total_seconds=None):
+    """One row per (bug, model) in the store's schema; revisions maps model names to revisions."""
+    created_at = datetime.now(timezone.utc)
+    explanation_hash, summary_hash = text_hash(explanation_text), text_hash(nlp_summary)
+    records = []
+    for model_name, score, error, seconds in results:
+        if model_name == "lexical":
+            revision, model_backend, model_threshold = LEXICAL_REVISION, "lexical", band[1]
+        else:
+            revision, model_backend, model_threshold = revisions.get(model_name), backend, threshold
+        records.append({
+            "run_id": RUN_ID,
+            "bug_id": bug_id,
+            "stage": stage,
+            "model": model_name,
+            "model_revision": revision,
+            "backend": model_backend,
+            "pooling": pooling,
+            "score": score,
+            "precision": getattr(score, "precision", None),
+            "recall": getattr(score, "recall", None),
+            "threshold": model_threshold,
+            "verdict": None if score is None else score >= model_threshold,
+            "error": error,
+            "model_seconds": seconds,
+            "total_seconds": total_seconds,
+            "explanation_hash": explanation_hash,
+            "summary_hash": summary_hash,
+            "created_at": created_at,
+        })
+    return records
+
+def append_records(records, store_dir=STORE_DIR):
+    """Write records as a new Parquet part; returns its path."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if not records:
+        return None
+    os.makedirs(store_dir, exist_ok=True)
+    table = pa.Table.from_pylist(records, schema=schema())
+    name = f"part-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet"
+    tmp_path = os.path.join(store_dir, f".{name}.tmp")
+    pq.write_table(table, tmp_path)
+    # Readers never see half-written parts: the rename is atomic
+    path = os.path.join(store_dir, name)
+    os.replace(tmp_path, path)
+    return path
+
+def append_comparison(bug_id, stage, results, explanation_text, nlp_summary, **kwargs):
+    return append_records(comparison_records(bug_id, stage, results, explanation_text, nlp_summary, **kwargs))
+
+def dataset(store_dir=STORE_DIR):
+    import pyarrow.dataset as ds
+    return ds.dataset(store_dir, format="parquet", schema=schema(), exclude_invalid_files=True)
+
+def match_rate_by_model(store_dir=STORE_DIR, latest_only=True):
+    """{model: (match rate, pairs scored)} over the store.
+
+    With latest_only, a bug scored by several runs only counts with its most recent result.
+    Comparisons stored without a bug id cannot be matched across runs, so each of them counts.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    table = dataset(store_dir).to_table(columns=["bug_id", "model", "verdict", "created_at"])
+    table = table.filter(pc.is_valid(table["verdict"]))
+    if latest_only:
+        # Join keys never match nulls: keep the rows without a bug id aside
+        anonymous = table.filter(pc.is_null(table["bug_id"]))
+        table = table.filter(pc.is_valid(table["bug_id"]))
+        latest = table.group_by(["bug_id", "model"]).aggregate([("created_at", "max")])
+        table = table.join(latest, keys=["bug_id", "model"])
+        table = table.filter(pc.equal(table["created_at"], table["created_at_max"]))
+        table = pa.concat_tables([table.select(anonymous.column_names), anonymous])
+    table = table.append_column("matched", pc.cast(table["verdict"], "int64"))
+    summary = table.group_by("model").aggregate([("matched", "mean"), ("matched", "count")])
+    return {
+        row["model"]: (row["matched_mean"], row["matched_count"])
+        for row in summary.to_pylist()
+    }
+
+def compact(store_dir=STORE_DIR):
+    """Merge every existing part into one file; parts appended meanwhile are left alone."""
+    import pyarrow.parquet as pq
+
+    parts = sorted(name for name in os.listdir(store_dir) if name.endswith(".parquet"))
+    if len(parts) < 2:
+        return None
+    table = pq.ParquetDataset([os.path.join(store_dir, name) for name in parts], schema=schema()).read()
+    merged = append_records(table.to_pylist(), store_dir)
+    for name in parts:
+        os.remove(os.path.join(store_dir, name))
+    return merged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query or maintain the score store.")
+    parser.add_argument("command", choices=["report", "compact"])
+    parser.add_argument("--all-runs", action="store_true", help="count every stored result, not just the latest per bug")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        merged = compact()
+        print(f"Compacted into {merged}" if merged else "Nothing to compact")
+    else:
+        for model_name, (rate, pairs) in sorted(match_rate_by_model(latest_only=not args.all_runs).items()):
+            print(f"→ [{model_name}]: match rate {rate:.0%} over {pairs} pairs")
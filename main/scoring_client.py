@@ -0,0 +1,50 @@
+# scoring_client.py
+import json
+import os
+import urllib.error
+import urllib.request
+
+DAEMON_HOST = os.environ.get("SCORING_DAEMON_HOST", "127.0.0.1")
+DAEMON_PORT = int(os.environ.get("SCORING_DAEMON_PORT", "8765"))
+CONNECT_TIMEOUT = 0.5  # seconds to wait for the health check
+SCORE_TIMEOUT = 600  # seconds to wait for a score response
+
+def daemon_url(path):
+    return f"http://{DAEMON_HOST}:{DAEMON_PORT}{path}"
+
+def daemon_running():
+    """Return True if a scoring daemon answers on the configured port."""
+    try:
+        with urllib.request.urlopen(daemon_url("/health"), timeout=CONNECT_TIMEOUT) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+def request_scores(explanation_text, nlp_summary, pooling):
+    """Ask the daemon to score a text pair. Returns None if no daemon is running."""
+    if not daemon_running():
+        return None
+    payload = json.dumps({
+        "explanation": explanation_text,
+        "summary": nlp_summary,
+        "pooling": pooling,
+    }).encode("utf-8")
+    request = urllib.request.Request(
+        daemon_url("/score"),
+        data=payload,
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=SCORE_TIMEOUT) as response:
+            body = json.load(response)
+    except (urllib.error.URLError, OSError):
+        return None
+    results = [tuple(result) for result in body["results"]]
+    if body.get("alignment"):
+        from comparison import AlignmentScore
+        results = [
+            (name, AlignmentScore(*body["alignment"][name], score), error, seconds)
+            if name in body["alignment"] else (name, score, error, seconds)
+            for name, score, error, seconds in results
+        ]
+    return results
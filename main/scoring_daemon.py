@@ -0,0 +1,85 @@
+# scoring_daemon.py
+# Keeps the models in comparison.semantic_models loaded and serves score requests,
+# so run_all.py does not pay the import and model load cost for every bug.
+#
+# Start once:    python scoring_daemon.py
+# comparison.py then uses it automatically through scoring_client.py.
+import json
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import comparison
+import scoring_client
+from embedding_cache import EmbeddingCache
+
+def load_all_models(manager):
+    """Load the semantic models once and keep them resident within the memory budget."""
+    for model_name in comparison.semantic_models:
+        try:
+            with manager.stage(f"load {model_name}"):
+                manager.get(model_name)
+        except Exception as e:
+            # score_texts retries the load per request and reports the error
+            print(f"⚠️ Could not load '{model_name}': {e}")
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "models": list(self.server.manager.resident)})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/score":
+            self._send_json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+            explanation_text = request["explanation"]
+            nlp_summary = request["summary"]
+            pooling = request.get("pooling", comparison.POOLING)
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+            return
+        if pooling not in comparison.POOLING_METHODS:
+            self._send_json(400, {"error": f"unknown pooling '{pooling}'"})
+            return
+        results = comparison.score_texts(
+            explanation_text, nlp_summary, pooling, self.server.manager, cache=self.server.embedding_cache
+        )
+        # JSON turns alignment scores into plain floats; their precision and recall go alongside
+        alignment = {
+            name: [score.precision, score.recall] for name, score, _, _ in results
+            if isinstance(score, comparison.AlignmentScore)
+        }
+        self._send_json(200, {"results": results, "alignment": alignment})
+
+    def log_message(self, format, *args):
+        pass  # keep the console for load and error messages
+
+def serve(host=scoring_client.DAEMON_HOST, port=scoring_client.DAEMON_PORT):
+    # Keeps as many models resident as fit in MODEL_RSS_BUDGET, the most valuable first
+    manager = comparison.new_model_manager(verbose=True)
+    load_all_models(manager)
+    # Single-threaded on purpose: requests are scored one at a time on the shared models
+    server = HTTPServer((host, port), ScoringHandler)
+    server.manager = manager  # the handler reaches both through self.server
+    server.embedding_cache = EmbeddingCache()
+    print(f"🚀 Scoring daemon listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,95 @@
+# validation.py
+# Gate between patch generation and analysis: a fix must parse and keep every top-level
+# definition of the buggy file before analyser.py sees it. Broken fixes are repaired cheaply
+# instead of being dropped or regenerated:
+#   - definitions the model left out are restored from the buggy file locally
+#     (context_slicer.splice treats the fix as an excerpt), no tokens spent;
+#   - syntax errors get up to REPAIR_ATTEMPTS repair prompts that contain only the lines
+#     around the error, answered with search/replace edits (patch_apply.py).
+import ast
+import os
+
+import context_slicer
+import patch_apply
+
+REPAIR_ATTEMPTS = int(os.environ.get("LLM_REPAIR_ATTEMPTS", 2))
+CONTEXT_LINES = 6  # lines shown on each side of a syntax error
+
+class ValidationError(Exception):
+    """The fix is still invalid after the allowed repairs."""
+
+def top_level_names(tree):
+    return {
+        node.name for node in tree.body
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+    }
+
+def syntax_error(code):
+    """The SyntaxError from parsing code, or None."""
+    try:
+        ast.parse(code)
+    except SyntaxError as e:
+        return e
+    return None
+
+def structure_error(buggy_code, fixed_code):
+    """Why fixed_code is not a plausible fix of buggy_code (syntax, lost definitions), or None."""
+    error = syntax_error(fixed_code)
+    if error is not None:
+        return f"syntax error on line {error.lineno}: {error.msg}"
+    try:
+        missing = top_level_names(ast.parse(buggy_code)) - top_level_names(ast.parse(fixed_code))
+    except SyntaxError:
+        return None  # nothing to compare against
+    if missing:
+        return f"top-level definitions removed: {', '.join(sorted(missing))}"
+    return None
+
+def error_context(code, lineno, context=CONTEXT_LINES):
+    """The lines around lineno."""
+    lines = code.splitlines()
+    lineno = min(max(lineno or 1, 1), max(len(lines), 1))
+    first, last = max(1, lineno - context), min(len(lines), lineno + context)
+    return "\n".join(lines[first - 1:last])
+
+def restore_definitions(buggy_code, fixed_code):
+    """fixed_code with the top-level definitions it dropped put back from buggy_code, or None."""
+    try:
+        restored = context_slicer.splice(buggy_code, fixed_code)
+    except context_slicer.SliceError:
+        return None
+    return restored if structure_error(buggy_code, restored) is None else None
+
+def validate_and_repair(buggy_code, fixed_code, repair=None, attempts=REPAIR_ATTEMPTS):
+    """fixed_code, repaired if needed; raises ValidationError if it cannot be made valid.
+
+    repair(context, message) returns the model's search/replace response
+    for a syntax error; without it syntax errors are not repaired.
+    """
+    previous = None  # what went wrong with the last repair, told to the model on a retry
+    for attempt in range(attempts + 1):
+        error = syntax_error(fixed_code)
+        if error is None:
+            break
+        message = f"syntax error on line {error.lineno}: {error.msg}"
+        if error.text and error.text.strip():
+            message += f" at `{error.text.strip()}`"
+        if repair is None or attempt == attempts:
+            raise ValidationError(message)
+        # A retry must not send the same prompt: it would get the same (cached) failing reply
+        request = message if previous is None else f"{message} (attempt {attempt + 1}: your previous edits {previous})"
+        try:
+            fixed_code = patch_apply.apply_response(fixed_code, repair(error_context(fixed_code, error.lineno), request))
+            previous = f"left this error: {message}"
+        except patch_apply.PatchApplyError as e:
+            print(f"⚠️ Repair {attempt + 1} could not be applied: {e}")
+            previous = f"could not be applied: {e}"
+
+    error = structure_error(buggy_code, fixed_code)
+    if error is not None:
+        restored = restore_definitions(buggy_code, fixed_code)
+        if restored is None:
+            raise ValidationError(error)
+        print(f"🩹 Restored from the buggy file: {error.split(': ', 1)[1]}")
+        fixed_code = restored
+    return fixed_code